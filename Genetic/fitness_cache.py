@@ -0,0 +1,66 @@
+#-*- coding: utf-8 -*-
+"""Fitness results of chromosomes that were already played.
+
+Elites are carried into the next generation unchanged and mating often gives
+back one of the parents, so the same chromosome gets scored again and again.
+The cache maps (chromosome, evaluation seed) to its fitness, keeps at most
+size entries (least recently used go first) and can be backed by a json file
+so a later run starts with the results of the previous ones.
+
+A fitness value also depends on how the games were played (their number and
+length, the search, the board). Those settings are written into the file
+with the entries, and a file saved with other settings is not loaded.
+"""
+import json
+import os
+from collections import OrderedDict
+
+class FitnessCache(object):
+	def __init__(self,size = 4096,path = None,settings = None):
+		self.size = size
+		self.path = path
+		self.settings = settings						#json-able, what the fitness values were played with
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		if path is not None and os.path.exists(path):
+			self.load()
+
+	@staticmethod
+	def key(chromosome,seed):
+		return (tuple(chromosome), seed)
+
+	def get(self,chromosome,seed):						#fitness, or None when it was never played
+		key = self.key(chromosome,seed)
+		if key not in self.entries:
+			self.misses += 1
+			return None
+		self.hits += 1
+		self.entries.move_to_end(key)
+		return self.entries[key]
+
+	def put(self,chromosome,seed,score):
+		key = self.key(chromosome,seed)
+		self.entries[key] = score
+		self.entries.move_to_end(key)
+		while len(self.entries) > self.size:				#evict the least recently used
+			self.entries.popitem(last=False)
+
+	def load(self):										#the entries of the file, when it has the same settings
+		with open(self.path) as f:
+			found = json.load(f)
+		if not isinstance(found, dict) or found.get('settings') != self.settings:
+			return										#other settings, or a file without them
+		for chromosome, seed, score in found['entries']:
+			if isinstance(seed, list):					#json turns tuple seeds into lists
+				seed = tuple(seed)
+			self.put(chromosome,seed,score)
+
+	def save(self):										#written to a temporary file first so an interrupted
+		if self.path is None:							#run doesn't leave a broken cache behind
+			return
+		tmp = self.path + '.tmp'
+		with open(tmp,'w') as f:
+			json.dump({'settings': self.settings,
+				'entries': [[list(chromosome), seed, score] for (chromosome, seed), score in self.entries.items()]}, f)
+		os.replace(tmp,self.path)
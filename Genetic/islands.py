@@ -0,0 +1,196 @@
+#-*- coding: utf-8 -*-
+"""Island model of the GA: one Genetic population per process, migrants over sockets.
+
+Every island is a process (on this host or another one) that evolves its
+own population of ppl chromosomes, so the whole population grows with every
+island that joins. The islands talk to one coordinator over TCP, one json
+message per line:
+
+	island -> coordinator	hello, stats (after every generation),
+							migrants (every migration generations), done
+	coordinator -> island	welcome (the settings of the run), migrants
+
+The coordinator waits until all islands said hello and sends every one the
+same welcome, the only point at which the islands wait for each other.
+After that no island waits: the best migrants chromosomes an island sends
+are passed on to the next island of the ring, which takes them in after
+whatever generation it is busy with (immigrate replaces its last children).
+The coordinator keeps the stats of every island and generation.
+
+	python3 cli.py train-ga --islands 4					all on this machine
+	python3 cli.py ga-coordinator --listen 0.0.0.0:5995 --islands 4
+	python3 cli.py ga-island coordinator-host:5995		once per island
+"""
+import json
+import multiprocessing
+import os
+import random
+import select
+import socket
+import sys
+
+import tetris
+
+PORT = 5995
+
+class Channel(object):									#newline separated json messages over a socket
+	def __init__(self, sock):
+		self.sock = sock
+		self.buffer = b''
+		self.pending = []
+		self.closed = False
+
+	def send(self, message):
+		self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+	def read(self):										#one recv, blocks until something arrives
+		data = self.sock.recv(1 << 16)
+		if not data:
+			self.closed = True
+			return
+		lines = (self.buffer + data).split(b'\n')
+		self.buffer = lines.pop()
+		self.pending.extend(json.loads(line.decode('utf-8')) for line in lines if line)
+
+	def poll(self, timeout=0):							#the messages that arrived, waiting at most timeout
+		while not self.closed and select.select([self.sock], [], [], timeout)[0]:
+			self.read()
+			timeout = 0
+		found, self.pending = self.pending, []
+		return found
+
+	def wait(self):										#the next message, None once the other side closed
+		while not self.pending and not self.closed:
+			self.read()
+		return self.pending.pop(0) if self.pending else None
+
+	def close(self):
+		self.sock.close()
+		self.closed = True
+
+def parse_address(address):							#"host:port" or "host", PORT when the port is left out
+	host, _, port = address.partition(':')
+	return host or '127.0.0.1', int(port) if port else PORT
+
+class Coordinator(object):
+	def __init__(self, islands, host='127.0.0.1', port=0, generations=10,
+			migration=tetris.migration, migrants=tetris.migrants, seed=None):
+		self.islands = islands
+		self.settings = {'generations': generations, 'migration': migration, 'migrants': migrants,
+			'seed': random.randrange(1 << 31) if seed is None else seed}
+		self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		self.server.bind((host, port))
+		self.server.listen(islands)
+		self.address = self.server.getsockname()		#the port actually bound, for port 0
+		self.channels = []
+		self.history = []								#stats messages, in the order they came in
+		self.results = {}								#island -> its done message
+
+	def accept(self):									#the one synchronisation: everybody is there
+		while len(self.channels) < self.islands:
+			sock, _ = self.server.accept()
+			channel = Channel(sock)
+			if channel.wait() is not None:
+				self.channels.append(channel)
+		for island, channel in enumerate(self.channels):
+			channel.send(dict(self.settings, type='welcome', island=island, islands=self.islands))
+
+	def run(self):										#(score, chromosome) of the best island result
+		self.accept()
+		running = set(range(self.islands))
+		while running:
+			socks = dict((self.channels[i].sock, i) for i in running)
+			for sock in select.select(list(socks), [], [])[0]:
+				island = socks[sock]
+				channel = self.channels[island]
+				for message in channel.poll():
+					self.handle(island, message, running)
+				if channel.closed and island in running:	#gone without a done message
+					print('island %d disconnected' % island)
+					running.discard(island)
+		for channel in self.channels:
+			channel.close()
+		self.server.close()
+		return self.best()
+
+	def handle(self, island, message, running):
+		if message['type'] == 'stats':
+			self.history.append(message)
+			print('island %d generation %d: average %.2f best %.2f %s' % (island, message['generation'],
+				message['average'], message['best'], message['chromosome']))
+		elif message['type'] == 'migrants':
+			target = self.next_island(island, running)
+			if target is not None:
+				try:
+					self.channels[target].send(message)
+				except socket.error:						#it finished meanwhile, its done is still on the way
+					pass
+		elif message['type'] == 'done':
+			self.results[island] = message
+			running.discard(island)
+
+	def next_island(self, island, running):			#the ring over the islands still running
+		for step in range(1, self.islands):
+			target = (island + step) % self.islands
+			if target in running:
+				return target
+		return None
+
+	def best(self):
+		found = [(result['best'], result['chromosome']) for result in self.results.values() if result['chromosome']]
+		return max(found) if found else None
+
+	def averages(self):									#average score per generation over the islands
+		found = {}
+		for stats in self.history:
+			found.setdefault(stats['generation'], []).append(stats['average'])
+		return [sum(found[g]) / len(found[g]) for g in sorted(found)]
+
+def run_island(address, workers=tetris.workers):
+	"""Runs one island against the coordinator at address ((host, port))
+	until its generations are done."""
+	channel = Channel(socket.create_connection(address))
+	channel.send({'type': 'hello', 'host': socket.gethostname()})
+	settings = channel.wait()
+	if settings is None:
+		return None
+	number = settings['island']
+	random.seed(settings['seed'] + number)				#every island starts from its own population
+	gen = tetris.Genetic(workers=workers)
+	for generation in range(1, settings['generations'] + 1):
+		gen.new_population()
+		score, chromosome = gen.best
+		channel.send({'type': 'stats', 'island': number, 'generation': generation,
+			'average': gen.plotting[-1], 'best': score, 'chromosome': chromosome})
+		if generation % settings['migration'] == 0:
+			channel.send({'type': 'migrants', 'island': number, 'generation': generation,
+				'chromosomes': gen.population[:settings['migrants']]})	#the elites, best first
+		for message in channel.poll():					#whatever came in meanwhile, nothing is waited for
+			if message['type'] == 'migrants':
+				gen.immigrate(message['chromosomes'])
+	score, chromosome = gen.best if gen.best else (0.0, None)
+	channel.send({'type': 'done', 'island': number, 'best': score, 'chromosome': chromosome})
+	channel.close()
+	return gen.best
+
+def _local_island(address, workers, verbose):			#a process of run_local
+	if not verbose:
+		sys.stdout = open(os.devnull, 'w')
+	run_island(address, workers)
+
+def run_local(islands, generations=10, migration=tetris.migration, migrants=tetris.migrants,
+		workers=tetris.workers, seed=None, verbose=False):
+	"""Coordinator in this process and islands localhost processes, returns
+	the coordinator after the run."""
+	coordinator = Coordinator(islands, '127.0.0.1', 0, generations, migration, migrants, seed)
+	processes = [multiprocessing.Process(target=_local_island, args=(coordinator.address, workers, verbose))
+		for i in range(islands)]
+	for process in processes:
+		process.start()
+	try:
+		coordinator.run()
+	finally:
+		for process in processes:
+			process.join()
+	return coordinator
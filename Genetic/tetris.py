@@ -41,9 +41,19 @@
 
 from random import randrange as rand
 from random import random
-import pygame, sys
-from copy import deepcopy
-import matplotlib.pyplot as plt
+from random import seed
+import sys, os
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from engine import landing, batch, search, transposition, phases, features
+from engine.pieces import PieceTable
+from engine.stats import BoardStats
+pygame = None										#set by the first TetrisApp
+from engine.game import Game
+from engine.stream import PieceStream, game_seeds
+from engine.lockstep import LockstepGames, stone_indices
+from fitness_cache import FitnessCache
 
 
 # The configuration
@@ -51,11 +61,33 @@ cell_size =	18
 cols =		15
 rows =		28
 maxfps = 	30
+play_speed= 'realtime'	#TetrisApp.run: 'realtime' one stone per frame at maxfps, 'turbo' unthrottled,
+frame_skip= 10			#'skip' unthrottled and the board drawn only every frame_skip stones
 ppl  =      32 			#population
 attr  =     7			#attributes of chromosome
 limit  =    1000		#since we are dealing with int, so limit for parameter tuning
 num =       3			#for each chromosome, to find fitness, run game this many times
 num_stones= 300			#run each game for this many stones,or game overs
+batch_eval = True		#score all placements of a stone in one numpy batch
+lookahead = 1			#stones searched per move: 2 adds next_stone, more average over the unknown ones
+beam =      8			#placements of a stone that get searched further when lookahead > 1
+tt_size =   1 << 15		#searches kept in the transposition table, 0 turns it off
+workers =   1			#processes playing fitness games, None for one per core
+lockstep =  False		#play all fitness games of a generation together as one numpy batch, same lines (seeded games, lookahead 1 only)
+piece_seed= 0			#seed of the stone sequences of the fitness games, None for unseeded games
+reseed =    False		#new stone sequences every generation instead of the same ones for the whole run
+cache_size= 4096		#fitness results kept for chromosomes that come back
+cache_file= None		#json file the fitness cache is kept in between runs, None for memory only
+profiling = False		#count calls and time of the hot phases, summaries per game and per generation
+racing =    False		#race the fitness games: short games first, full ones only for chromosomes that can still make the top half (not in lockstep)
+race_rungs= 3			#rungs of the race, every rung plays more games and twice the stones, the last one num games of num_stones
+race_confidence= 1.0	#standard errors between a chromosome's estimated fitness and the ends of the interval it is raced with.
+						#The higher, the fewer chromosomes drop out early: more stones are played and the top half is more
+						#often the exact one. 1 plays 1.24x fewer stones, 2 only 1.07x; the top half survives its games and
+						#is always played in full, so at most the stones of the bottom half can be saved
+migration = 5			#island model (islands.py): generations between two migrations
+migrants =  2			#best chromosomes an island sends to the next one at every migration
+best_params = [38, 32, 59, 45, 46, 10, 40]	#best chromosome found so far, the default of cli.py play genetic
 
 colors = [
 (0,   0,   0  ),
@@ -94,343 +126,188 @@ tetris_shapes = [
 	 [[6, 6, 6, 6]]					#one more added
 ]
 
-def rotate_clockwise(shape):							#this function takes stone and rotate it clockwise
-	return [ [ shape[y][x]
-			for y in range(len(shape)) ]
-		for x in range(len(shape[0]) - 1, -1, -1) ]
-
-def check_collision(board, shape, offset):				#this function checks collision of onew stone with another
-	off_x, off_y = offset
-	for cy, row in enumerate(shape):
-		for cx, cell in enumerate(row):
-			try:
-				if cell and board[ cy + off_y ][ cx + off_x ]:
-					return True
-			except IndexError:
-				return True
-	return False
-
-def remove_row(board, row):								#this function clears row
-	del board[row]
-	return [[0 for i in range(cols)]] + board
-	
-def join_matrixes(mat1, mat2, mat2_off):				#this function generates new board by adding original board and stone
-	off_x, off_y = mat2_off
-	for cy, row in enumerate(mat2):
-		for cx, val in enumerate(row):
-			mat1[cy+off_y-1	][cx+off_x] += val
-	return mat1
-
-def new_board():										#this function generates new board
-	board = [ [ 0 for x in range(cols) ]
-			for y in range(rows) ]
-	board += [[ 1 for x in range(cols)]]
-	return board
-
-class TetrisApp(object):
-	def __init__(self,params,test = False):				#this is a constructor
-		pygame.init()
-		self.test = test
-		pygame.key.set_repeat(250,25)
-		self.width = cell_size*(cols+6)
-		self.height = cell_size*rows
-		self.rlim = cell_size*cols
-		self.bground_grid = [[ 8 if x%2==y%2 else 0 for x in range(cols)] for y in range(rows)]
-		
-		self.default_font =  pygame.font.Font(
-			pygame.font.get_default_font(), 12)
-
-		self.params = params
-		
-		self.screen = pygame.display.set_mode((self.width, self.height))
-		pygame.event.set_blocked(pygame.MOUSEMOTION) # We do not need
-		                                             # mouse movement
-		                                             # events, so we
-		                                             # block them.
-		self.next_stone = tetris_shapes[rand(len(tetris_shapes))]
-		self.init_game()
-	
-	def new_stone(self):							#this function generates new random stone 
-		self.stone = self.next_stone[:]
-		self.next_stone = tetris_shapes[rand(len(tetris_shapes))]
-		self.stone_x = int(cols / 2 - len(self.stone[0])/2)
-		self.stone_y = 0
-		self.stones += 1
-		if check_collision(self.board,
-		                   self.stone,
-		                   (self.stone_x, self.stone_y)):
-			self.gameover = True
-
-
-	
-	def init_game(self):							#this function initialise the game
-		self.board = new_board()
-		self.stones = 0
-		self.new_stone()
-		self.level = 1
-		self.score = 0
-		self.lines = 0
-		pygame.time.set_timer(pygame.USEREVENT+1, 1000)
-	
-	def disp_msg(self, msg, topleft):				#this function display messages after game 
-		x,y = topleft		
-		for line in msg.splitlines():
-			self.screen.blit(
-				self.default_font.render(
-					line,
-					False,
-					(255,255,255),
-					(0,0,0)),
-				(x,y))
-			y+=14
-	
-	def center_msg(self, msg):						#this function sets message in the center
-		for i, line in enumerate(msg.splitlines()):
-			msg_image =  self.default_font.render(line, False,
-				(255,255,255), (0,0,0))
-		
-			msgim_center_x, msgim_center_y = msg_image.get_size()
-			msgim_center_x //= 2
-			msgim_center_y //= 2
-		
-			self.screen.blit(msg_image, (
-			  self.width // 2-msgim_center_x,
-			  self.height // 2-msgim_center_y+i*22))
-	
-	def draw_matrix(self, matrix, offset):			#this function draw matrix
-		off_x, off_y  = offset
-		for y, row in enumerate(matrix):
-			for x, val in enumerate(row):
-				if val:
-					pygame.draw.rect(
-						self.screen,
-						colors[val],
-						pygame.Rect(
-							(off_x+x) *
-							  cell_size,
-							(off_y+y) *
-							  cell_size, 
-							cell_size,
-							cell_size),0)
-	
-	def add_cl_lines(self, n):
-		linescores = [0, 40, 100, 300, 1200]
-		self.lines += n
-		self.score += linescores[n] * self.level
-		if self.lines >= self.level*6:
-			self.level += 1
-			newdelay = 1000-50*(self.level-1)
-			newdelay = 100 if newdelay < 100 else newdelay
-			pygame.time.set_timer(pygame.USEREVENT+1, newdelay)
-	
-	def move(self, delta_x):				
-		if not self.gameover and not self.paused:
-			new_x = self.stone_x + delta_x
-			if new_x < 0:
-				new_x = 0
-			if new_x > cols - len(self.stone[0]):
-				new_x = cols - len(self.stone[0])
-			if not check_collision(self.board,
-			                       self.stone,
-			                       (new_x, self.stone_y)):
-				self.stone_x = new_x
-	def quit(self):
-		self.center_msg("Exiting...")
-		pygame.display.update()
-		sys.exit()
-	
-	def drop(self, manual):
-		if not self.gameover and not self.paused:
-			self.score += 1 if manual else 0
-			self.stone_y += 1
-			if check_collision(self.board,
-			                   self.stone,
-			                   (self.stone_x, self.stone_y)):
-				self.board = join_matrixes(
-				  self.board,
-				  self.stone,
-				  (self.stone_x, self.stone_y))
-				self.new_stone()
-
-
+max_cells = max(sum(1 for row in shape for cell in row if cell) for shape in tetris_shapes)	#blocks of the biggest stone
+def spawn_x(shape):									#Game.spawn_x of a stone
+	return int(cols/2 - len(shape[0])/2)
 
+piece_table = PieceTable(tetris_shapes, cols, spawn_x)	#distinct orientations of every stone, built once, the
+														#columns swept from the spawn column like check_score always did
+transpositions = transposition.TranspositionTable(tt_size) if tt_size else None	#searched boards, shared by all games of the process
 
+def eval_settings():									#what a fitness value depends on besides the chromosome
+	return {'num': num, 'num_stones': num_stones, 'lookahead': lookahead, 'beam': beam,	#and the seed
+		'cols': cols, 'rows': rows, 'shapes': tetris_shapes}
 
+def score_weights(params):							#score_board's weights with their signs, in the feature order of batch.genetic_features
+	return [-params[0], -params[1], params[2], -params[3], params[4], params[5], -params[6]]
 
-
-
-				cleared_rows = 0
-				while True:
-					for i, row in enumerate(self.board[:-1]):
-						if 0 not in row:
-							self.board = remove_row(
-							  self.board, i)
-							cleared_rows += 1
-							break
-					else:
-						break
-				self.add_cl_lines(cleared_rows)
-				return True
-		return False
-	
-	def insta_drop(self):
-		if not self.gameover and not self.paused:
-			while(not self.drop(True)):
-				pass
-	
-	def rotate_stone(self):
-		if not self.gameover and not self.paused:
-			new_stone = rotate_clockwise(self.stone)
-			if not check_collision(self.board,
-			                       new_stone,
-			                       (self.stone_x, self.stone_y)):
-				self.stone = new_stone
-
-	
-	def toggle_pause(self):
-		self.paused = not self.paused
-	
-	def start_game(self):
-		if self.gameover:
-			self.init_game()
-			self.gameover = False
+class TetrisGame(Game):							#the game and the AI player, without pygame
+	def __init__(self,params,stream = None):
+		self.params = params
+		self.version = tuple(params)						#transposition table entries are only valid for these weights
+		Game.__init__(self, cols, rows, tetris_shapes, stream)
 
 #############################################################################################################################
 ###Code appended for the project
 ##############################################################################################################################
 
 
-	def height_diff_sum(self,board):						#this function returns difference between maximum and minimum height
-		global rows,cols 									#and sum of heights and height on walls
-		heights = []
-		for y in range(len(board[0])):
+	def score_board(self,board):								#this function calculates weighted score, the features
+																#come from one pass of engine.features
+		(height,holes,clears,blockades,almost_clear,walls,diff) = features.genetic(features.board_features(board))
 
-			h = len(board)
-			for x in range(len(board)):
-				if board[x][y] != 0:
-					break
-				h -= 1
-			heights.append(h)
-		hs = deepcopy(heights)
-		hs.sort()
-		return (hs[-1] - hs[0],sum(heights),heights[0] + heights[cols - 1])
-
-
-	def holes_blockades(self,board):						#this function returns number of holes and 
-		holes = 0 											#number of blockades
-		blockades = 0
-		for y in range(len(board[0])):
-
-			for x in range(len(board)):
-				if board[x][y] != 0:
-					break
-
-			hol = 0
-			block = 0
-			while x<rows:
-				if board[x][y] == 0:
-					hol += 1
-					blockades += block
-					block = 0
-				else: block += 1
-				x+=1
-
-			holes += hol
+		return height*(-1)*self.params[0] + holes*(-1)*self.params[1] + clears*self.params[2] + blockades*(-1)*self.params[3] + almost_clear*self.params[4] + walls*self.params[5] + diff*(-1)*self.params[6]
 
-		return (holes,blockades)
 
-	def clears(self,board):										#this function returns number of clears (row fully occupied by stones) 
-																#and almost clear (1 or 2 stones left to clear row)
-		holes_in_row = [cols for i in range(len(board))]
-		for y in range(len(board[0])):
-			for x in range(len(board)):
-				if board[x][y] == 0:
-					holes_in_row[x] -= 1
 
-		clears = sum(1 if x == 0 else 0  for x in holes_in_row) 
-		almost_clear = sum(1 if x == 1 or x == 2 else 0 for x in holes_in_row)
+	def score_stats(self,stats):							#same score as score_board, read from BoardStats
+		heights = [h + 1 for h in stats.heights]					#score_board counts the floor row too
+		diff = max(heights) - min(heights)
+		height = sum(heights)
+		walls = heights[0] + heights[cols - 1]
+		holes = sum(stats.holes)
+		blockades = stats.blockades()
+		clears = stats.row_fill.count(0)
+		almost_clear = stats.row_fill.count(1) + stats.row_fill.count(2)
 
-		return (clears,almost_clear)
+		return height*(-1)*self.params[0] + holes*(-1)*self.params[1] + clears*self.params[2] + blockades*(-1)*self.params[3] + almost_clear*self.params[4] + walls*self.params[5] + diff*(-1)*self.params[6]
 
 
 
-	def score_board(self,board):
+	def evaluate(self,boards):								#score_board of a stack of boards
+		return batch.genetic_features(boards).dot(score_weights(self.params))
 
 
-		(diff,height,walls)  = self.height_diff_sum(board)			#this function calculates weighted score
-		(holes,blockades) = self.holes_blockades(board)
-		(clears,almost_clear) = self.clears(board)
 
-		return height*(-1)*self.params[0] + holes*(-1)*self.params[1] + clears*self.params[2] + blockades*(-1)*self.params[3] + almost_clear*self.params[4] + walls*self.params[5] + diff*(-1)*self.params[6]
+	#check_score with every placement scored in one batch, searched over depth stones:
+	#the current one, next_stone and the still unknown ones after it
+	def check_score_search(self,stats,depth):
+		stones = ([self.stone, self.next_stone] + [None]*(depth - 2))[:depth]
+		found = search.lookahead(stats, stones, piece_table, tetris_shapes, self.evaluate, beam, False, transpositions, self.version)
+		if found is None:
+			return (0,0,0)
+		orient, new_x = found[0], found[1]
+		return (max(new_x - self.stone_x, 0), max(self.stone_x - new_x, 0), orient.rot)
 
 
 
 	def check_score(self):							#this function calculates
 													#score for every possible combination 	
-		stone = deepcopy(self.stone)				#of stone with board and  
-		stone_x = self.stone_x						#returns its weighted score
-		stone_y = self.stone_y						
+		stone_x = self.stone_x						#of stone with board and returns its weighted score
 		finalScore = (-1)*float("inf")  			
 		Right = 0
 		Left = 0
 		Rotations = 0
+		stats = BoardStats(list(self.bboard), cols)						#heights, holes and row fills are
+		if lookahead > 1 or batch_eval:									#updated per candidate, not rescanned
+			return self.check_score_search(stats, lookahead)
+		tt_key = transposition.key(stats, [self.stone], (self.version, stone_x))
+		if transpositions is not None:
+			found = transpositions.get(tt_key)
+			if found is not None:
+				return found
+		tops = stats.tops()
+
+		for orient in piece_table.get(self.stone):			#only distinct rotations, only legal columns
+			for new_x, new_y in zip(orient.xs, landing.landing_rows(stats.board, tops, orient)):
+				if new_y == 0:								#collides right at spawn, not a real move
+					continue
+				tempStats = stats.copy()
+				tempStats.place(orient, new_x, new_y, clear=False)
+
+				score = self.score_stats(tempStats)
 
-		for i in range(4):
-			new_x = stone_x
-			while new_x <= cols - len(stone[0]):
-				tempBoard = deepcopy(self.board)
-				new_y = stone_y
-				while check_collision(tempBoard,stone,(new_x, new_y)) == False:
-					new_y += 1
-
-				tempBoard = join_matrixes(
-				  tempBoard,
-				  stone,
-				  (new_x, new_y))
-
-				score = self.score_board(tempBoard)
-				
-				if score > finalScore:
-					finalScore = score
-					Right = abs(new_x - stone_x)
-					Left = 0
-					Rotations = i
-				new_x = new_x + 1
-			new_x = stone_x
-			# print("Left jaayegaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa")
-			while new_x >= 0:
-				tempBoard = deepcopy(self.board)
-				new_y = stone_y
-
-				while check_collision(tempBoard,stone,(new_x, new_y)) == False:
-					new_y += 1
-
-				tempBoard = join_matrixes(
-				  tempBoard,
-				  stone,
-				  (new_x, new_y))
-
-				score = self.score_board(tempBoard)
-
-				# print(self.score_board(tempBoard))
-				# print(tempBoard)
 				if score > finalScore:
 					finalScore = score
-					Right = 0
-					Left = abs(new_x - stone_x)
-					Rotations = i
-					# print(finalScore,Right,Left,Rotations)
+					Right = max(new_x - stone_x, 0)
+					Left = max(stone_x - new_x, 0)
+					Rotations = orient.rot
 
-				new_x = new_x - 1
+		if transpositions is not None:
+			transpositions.put(tt_key, (Right,Left,Rotations))
+		return (Right,Left,Rotations)
+
+
+
+	def play_move(self):							#plays the current stone where check_score puts it
+		(R,L,Rot) = self.check_score()
+
+		for c in range(Rot):
+			self.rotate_stone()
+		for c in range(R):
+			self.move(+1)
+		for c in range(L):
+			self.move(-1)
+
+		self.insta_drop()
+
+	def play(self,stones = None):					#plays a game of num_stones stones (or until game over), stones
+		limit = num_stones if stones is None else stones	#stops it earlier and a later call goes on from there
+		while self.gameover == False and self.stones <= limit:
+			self.play_move()
+
+	def finished(self):
+		return self.gameover or self.stones > num_stones
+
+	def lines_bound(self):							#most lines the game can still end with: every block on the
+		if self.finished():							#board and of the stones to come fills a row
+			return self.lines
+		field = ((1 << cols) - 1) << 1
+		blocks = sum(bin(row & field).count('1') for row in self.bboard[:-1])
+		return self.lines + (blocks + (num_stones + 1 - self.stones)*max_cells) // cols
 
-			stone = rotate_clockwise(stone)
 
-		return (Right,Left,Rotations)
 
+class TetrisApp(TetrisGame):						#TetrisGame drawn with pygame
+	def __init__(self,params,test = False):				#this is a constructor
+		global pygame									#pygame is only imported with the first window,
+		from engine import render						#headless games and pool workers never load it
+		pygame = render.start()
+		self.test = test
+		pygame.key.set_repeat(250,25)
+		self.width = cell_size*(cols+6)
+		self.height = cell_size*rows
+		self.rlim = cell_size*cols
+		
+		self.default_font =  pygame.font.Font(
+			pygame.font.get_default_font(), 12)
+		
+		self.screen = pygame.display.set_mode((self.width, self.height))
+		pygame.event.set_blocked(pygame.MOUSEMOTION) # We do not need
+		                                             # mouse movement
+		                                             # events, so we
+		                                             # block them.
+		self.renderer = render.Renderer(self.screen, cols, rows, cell_size, colors, self.default_font)
+		TetrisGame.__init__(self, params)
 
+	def init_game(self):							#this function initialise the game
+		TetrisGame.init_game(self)
+		pygame.time.set_timer(pygame.USEREVENT+1, 1000)
 
+	def level_up(self):
+		newdelay = 1000-50*(self.level-1)
+		newdelay = 100 if newdelay < 100 else newdelay
+		pygame.time.set_timer(pygame.USEREVENT+1, newdelay)
 	
-	def run(self):
+	def center_msg(self, msg):						#this function sets message in the center
+		for i, line in enumerate(msg.splitlines()):
+			msg_image =  self.renderer.text(line)
+		
+			msgim_center_x, msgim_center_y = msg_image.get_size()
+			msgim_center_x //= 2
+			msgim_center_y //= 2
+		
+			self.screen.blit(msg_image, (
+			  self.width // 2-msgim_center_x,
+			  self.height // 2-msgim_center_y+i*22))
+	
+	def quit(self):
+		self.center_msg("Exiting...")
+		pygame.display.update()
+		sys.exit()
+	
+
+	def run(self,speed = play_speed,skip = frame_skip):
 		key_actions = {
 			'ESCAPE':	self.quit,
 			'LEFT':		lambda:self.move(-1),
@@ -449,58 +326,26 @@ class TetrisApp(object):
 		
 		dont_burn_my_cpu = pygame.time.Clock()
 		while 1:
-			self.screen.fill((0,0,0))
 			if self.gameover:
-				self.center_msg("""Game Over!\nYour score: %d Press space to continue""" % self.score)
-			else:
-				if self.paused:
-					self.center_msg("Paused")
-				else:
-					pygame.draw.line(self.screen,
-						(255,255,255),
-						(self.rlim+1, 0),
-						(self.rlim+1, self.height-1))
-					self.disp_msg("Next:", (
-						self.rlim+cell_size,
-						2))
-					self.disp_msg("Score: %d\n\nLevel: %d\ \nLines: %d" % (self.score, self.level, self.lines),
-						(self.rlim+cell_size, cell_size*5))
-					self.draw_matrix(self.bground_grid, (0,0))
-					self.draw_matrix(self.board, (0,0))
-					self.draw_matrix(self.stone,
-						(self.stone_x, self.stone_y))
-					self.draw_matrix(self.next_stone,
-						(cols+1,2))
-			pygame.display.update()
+				self.renderer.message("""Game Over!\nYour score: %d Press space to continue""" % self.score)
+			elif self.paused:
+				self.renderer.message("Paused")
+			elif speed != 'skip' or self.stones % skip == 0:
+				self.renderer.draw(self.board, self.stone, (self.stone_x, self.stone_y), self.next_stone,
+					"Score: %d\n\nLevel: %d\ \nLines: %d" % (self.score, self.level, self.lines),
+					(self.rlim+cell_size, cell_size*5))
 
 
 
 			if self.test == False:
 				if self.gameover == False and self.stones <= num_stones:
-					(R,L,Rot) = self.check_score()
-
-					for c in range(Rot):
-						self.rotate_stone()
-					for c in range(R):
-						self.move(+1)
-					for c in range(L):
-						self.move(-1)
-
-					self.insta_drop()
-
+					self.play_move()
 				else:
+					if phases.enabled:
+						print(self.phase_report())
 					break
 			else:
-					(R,L,Rot) = self.check_score()
-
-					for c in range(Rot):
-						self.rotate_stone()
-					for c in range(R):
-						self.move(+1)
-					for c in range(L):
-						self.move(-1)
-
-					self.insta_drop()				
+					self.play_move()
 			
 			for event in pygame.event.get():						#may be not needed
 				if event.type == pygame.USEREVENT+1:
@@ -514,16 +359,43 @@ class TetrisApp(object):
 						if event.key == eval("pygame.K_"+key):
 							pass
 
-							
-			dont_burn_my_cpu.tick(maxfps)
+			if speed == 'realtime' or self.gameover or self.paused:	#nothing to hurry for on a message screen
+				dont_burn_my_cpu.tick(maxfps)
 
 	
 
 
 
+phases.register(TetrisGame, 'score_board', 'score_board')
+phases.register(TetrisGame, 'score_stats', 'score_board.stats')
+phases.register(TetrisGame, 'evaluate', 'score_board.batch')
+phases.register(TetrisGame, 'check_score', 'check_score')
+if profiling:
+	phases.enable()
+
+
+
+def play_game(chromosome,seed = None):				#one fitness game, module level so worker processes can run it
+	stream = PieceStream(seed, len(tetris_shapes), num_stones + 2) if seed is not None else None
+	App = TetrisGame(chromosome,stream)				#headless, no window and no frame cap
+	App.play()
+	return App.lines 		#it could be App.score
+
+def play_rung(game,chromosome,seed,stones):			#a raced game stones further, started when game is None
+	if game is None:
+		stream = PieceStream(seed, len(tetris_shapes), num_stones + 2) if seed is not None else None
+		game = TetrisGame(chromosome,stream)
+	game.play(stones)
+	return game
+
+
+
 class Genetic(object):
 	#Initialise population with random set of parameters
-	def __init__(self):									
+	def __init__(self,workers = workers,cache = None):
+		self.workers = workers
+		self.cache = cache if cache is not None else FitnessCache(cache_size,cache_file,eval_settings())
+		self.eval_seed = piece_seed						#every chromosome of a generation plays the games of this seed
 		self.population = []
 		for i in range(ppl):
 			chromosome = []
@@ -533,23 +405,162 @@ class Genetic(object):
 			self.population.append(chromosome)
 
 		self.plotting = []
+		self.best = None								#(score, chromosome) of the last generation played
+		self.race_stones = 0							#stones the last race played
+		self.race_full = 0								#and the chromosomes it played to the end
 		# self.population[0] = [1,30,60,31,18]			#set manually, gives good score
+		if racing and lockstep:
+			print("racing: the raced games are played one by one, lockstep is not used")
 
 
 
 	#for every set of parameters it calculates score by running a small instance of game
 	def fitness(self,chromosome):
 		sum_score = 0.0
-		for i in range(num):
-			App = TetrisApp(chromosome)
-			App.run()
-			sum_score += App.lines 		#it could be App.score
-			del App
+		for game_seed in self.game_seeds():
+			sum_score += play_game(chromosome,game_seed)
 
 		return sum_score
 
 
 
+	#seeds of the num fitness games, the same for every chromosome of the generation
+	def game_seeds(self):
+		if self.eval_seed is None:
+			return [None] * num
+		return game_seeds(self.eval_seed, num)
+
+
+
+	#fitness of the whole population, in population order. Chromosomes found in the cache
+	#aren't played again and duplicates in the population are played once. With racing
+	#only the fitness values that are exact go into the cache, and unseeded games (a new
+	#draw of pieces each time) aren't cached at all
+	def population_fitness(self):
+		cached = self.eval_seed is not None
+		results = {}
+		todo = []
+		for chromosome in self.population:
+			key = tuple(chromosome)
+			if key in results:
+				continue
+			results[key] = self.cache.get(chromosome,self.eval_seed) if cached else None
+			if results[key] is None:
+				todo.append(chromosome)
+
+		if racing and todo:
+			counts = [self.population.count(chromosome) for chromosome in todo]
+			known = [results[tuple(chromosome)] for chromosome in self.population if results[tuple(chromosome)] is not None]
+			scores, exact = self.race_fitness(todo, counts, known)
+		else:
+			scores = self.play_fitness(todo)
+			exact = [True] * len(todo)
+		for chromosome, score, full in zip(todo, scores, exact):
+			results[tuple(chromosome)] = score
+			if full and cached:
+				self.cache.put(chromosome,self.eval_seed,score)
+		if cached:
+			self.cache.save()
+
+		return [results[tuple(chromosome)] for chromosome in self.population]
+
+
+
+	#fitness of chromosomes, in order. With more than one worker the (chromosome, game)
+	#jobs go to a process pool and are summed back in job order
+	def play_fitness(self,chromosomes):
+		if lockstep and lookahead == 1 and self.eval_seed is not None and chromosomes:
+			return self.lockstep_fitness(chromosomes)
+		if self.workers == 1 or not chromosomes:
+			return [self.fitness(chromosome) for chromosome in chromosomes]
+
+		jobs = [(chromosome, game_seed) for chromosome in chromosomes for game_seed in self.game_seeds()]
+		with Pool(self.workers, initializer=seed) as pool:	#unseeded games would otherwise share one random state
+			lines = pool.starmap(play_game, jobs, chunksize=1)
+
+		return [sum(lines[k*num:(k+1)*num], 0.0) for k in range(len(chromosomes))]
+
+
+
+	#fitness of chromosomes by successive halving. Every rung plays the games of the chromosomes
+	#still in the race a bit further (more games, twice the stones, the last rung all num games
+	#of num_stones; the first one two games so the spread of the games can be seen). After a
+	#rung every game gets a prediction of its lines: a finished game its lines, a running one
+	#its lines at the rate it cleared them so far. A chromosome is estimated at num times the
+	#mean of its predictions, give or take race_confidence standard errors: the standard
+	#deviation of a game around the mean of its chromosome, pooled over the population, times
+	#the root of the summed squares of the unplayed share of every game. The interval never
+	#leaves lines (what it has) and lines_bound (what it can still get). A chromosome whose
+	#upper end is below the lower ends of ppl/2 others is out (counts is how often it is in
+	#the population, known the fitness values of the rest). The seeded games go on where they
+	#stopped, so the chromosomes that finish the race get exactly the fitness of play_fitness;
+	#the others get their estimate. Returns (scores, exact) in chromosome order. With more than
+	#one worker the games of a rung go to a process pool and come back to be continued
+	def race_fitness(self,chromosomes,counts,known):
+		if self.workers == 1:
+			return self.race(chromosomes,counts,known,lambda jobs: [play_rung(*job) for job in jobs])
+		with Pool(self.workers, initializer=seed) as pool:
+			return self.race(chromosomes,counts,known,lambda jobs: pool.starmap(play_rung, jobs, chunksize=1))
+
+	def race(self,chromosomes,counts,known,play):
+		seeds = self.game_seeds()
+		games = [[None] * num for chromosome in chromosomes]
+		racing_now = list(range(len(chromosomes)))
+		top = int(ppl/2)
+		length = num_stones + 1								#stones of a whole game
+		fresh_bound = num_stones*max_cells // cols			#lines_bound of a game that wasn't started
+		scores = [0.0] * len(chromosomes)
+		for rung in range(race_rungs):
+			n_games = min(num, max(2, num*(rung + 1) // race_rungs))
+			stones = max(1, num_stones >> (race_rungs - 1 - rung))
+			jobs = [(i, g) for i in racing_now for g in range(n_games) if games[i][g] is None or not games[i][g].finished()]
+			played = play([(games[i][g], chromosomes[i], seeds[g], stones) for i, g in jobs])
+			for (i, g), game in zip(jobs, played):
+				games[i][g] = game
+			predicted = {}
+			for i in racing_now:
+				started = [game for game in games[i] if game is not None]
+				predicted[i] = [game.lines if game.finished() else game.lines*float(length)/game.stones for game in started]
+				scores[i] = sum(predicted[i])*num/len(started)
+			if rung == race_rungs - 1:
+				break
+			squares = sum((x - scores[i]/num)**2 for i in racing_now for x in predicted[i])
+			freedom = sum(len(predicted[i]) - 1 for i in racing_now)
+			deviation = (squares/freedom)**0.5 if freedom else float('inf')
+			lower = {}
+			upper = {}
+			for i in racing_now:
+				unplayed = sum((1.0 if game is None else 0.0 if game.finished() else (length - game.stones)/float(length))**2
+					for game in games[i])
+				width = race_confidence*deviation*unplayed**0.5 if unplayed else 0.0
+				lines = sum(game.lines for game in games[i] if game is not None)
+				bound = sum(game.lines_bound() if game is not None else fresh_bound for game in games[i])
+				lower[i] = max(lines, scores[i] - width)
+				upper[i] = min(bound, scores[i] + width)
+			entries = sorted(known + [lower[i] for i in racing_now for c in range(counts[i])], reverse=True)
+			if len(entries) >= top:
+				racing_now = [i for i in racing_now if upper[i] >= entries[top - 1]]
+		self.race_stones = sum(game.stones for row in games for game in row if game is not None)
+		exact = [all(game is not None and game.finished() for game in row) for row in games]
+		self.race_full = sum(exact)
+		return scores, exact
+
+
+
+	#play_fitness with every (chromosome, game) pair advanced in lockstep as one batch,
+	#the games play out exactly like TetrisGame.play
+	def lockstep_fitness(self,chromosomes):
+		seeds = self.game_seeds()
+		jobs = [(chromosome, game_seed) for chromosome in chromosomes for game_seed in seeds]
+		games = LockstepGames(cols, rows, piece_table, tetris_shapes,
+			stone_indices([game_seed for _, game_seed in jobs], len(tetris_shapes), num_stones + 2),
+			[score_weights(chromosome) for chromosome, _ in jobs], num_stones)
+		lines = games.run().tolist()
+
+		return [sum(lines[k*num:(k+1)*num], 0.0) for k in range(len(chromosomes))]
+
+
+
 	#this function takes two parents and calculates its offspring by random selection and mutation
 	def mating(self,chromosome1, chromosome2):
 		new_chromosome = []
@@ -568,18 +579,24 @@ class Genetic(object):
 
 	#this function update the current population by mating of fittest population (mating from 50% of fittest population)
 	def new_population(self):
-		scores = []
-		for chromosome in self.population:
-			scores.append(self.fitness(chromosome))
+		if reseed and self.eval_seed is not None:
+			self.eval_seed = rand(1 << 31)
+		since = phases.snapshot()
+		scores = self.population_fitness()
 
 		self.plotting.append(sum(scores)/(len(scores)*num*1.0))
 
 		print("\n Population : each individual average score with " +  str(num_stones) + " stones \n")
 		for (x,y) in zip(self.population,scores):
 			print(x,"  ->  ",y/num)
+		if phases.enabled:									#games played by pool workers aren't counted here
+			print(phases.report('generation', since))
+		if racing and self.race_stones:
+			print("racing: %d stones played, %d chromosomes played in full" % (self.race_stones, self.race_full))
 
 		curr_population = [x for _,x in sorted(zip(scores,self.population))]
 		curr_population.reverse()
+		self.best = (max(scores)/num, curr_population[0])	#best average score of the generation and its chromosome
 		newPopulation = curr_population[0:int(ppl/5)]		#check whether these two
 		for i in range(ppl - int(ppl/5)):					#rows give equal number of population
 			first = curr_population[rand(0,ppl/2)]
@@ -587,12 +604,27 @@ class Genetic(object):
 			newPopulation.append(self.mating(first,second))
 		self.population = newPopulation
 
+	#chromosomes migrating in from another island take the places of the last children,
+	#the elites stay
+	def immigrate(self,chromosomes):
+		chromosomes = [list(chromosome) for chromosome in chromosomes][:ppl - int(ppl/5)]
+		if chromosomes:
+			self.population[-len(chromosomes):] = chromosomes
+
 	def run(self,iterations):
 		for i in range(iterations):
 			print ('generation '+str(i+1)+' population:')
 			print (self.population)
 			self.new_population()
 
+	def plot(self):										#average score per generation, matplotlib is only imported here
+		import matplotlib.pyplot as plt
+		plt.plot(self.plotting)
+		plt.xlabel('iteration no.')
+		plt.ylabel('score (clears)')
+		plt.title('Run for different plays')
+		plt.show()
+
 
 if __name__ == '__main__':
 
@@ -604,12 +636,8 @@ if __name__ == '__main__':
 	for iterations in range(1):
 		Gen = Genetic()
 		Gen.run(10)
-		# plt.plot(Gen.plotting)
+		# Gen.plot()
 
-	# plt.xlabel('iteration no.')
-	# plt.ylabel('score (clears)')
-	# plt.title('Run for different plays')
-	# plt.show()
 	# App = TetrisApp([152, 0, 129, 192, 132, 51, 169],True)
 	# App.run()
 	# App = TetrisApp([42, 21, 57, 27, 15, 16, 43],True)
@@ -621,7 +649,7 @@ if __name__ == '__main__':
     ###Change the fps to 5 for better visibility
 
       
-	# App = TetrisApp([38, 32, 59, 45, 46, 10, 40],True) #best 
+	# App = TetrisApp(best_params,True) #best 
 	# App.run()
 
 
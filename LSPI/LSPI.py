@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python
 #-*- coding: utf-8 -*-
 
 # NOTE FOR WINDOWS USERS:
@@ -38,16 +38,26 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
+from __future__ import print_function
 import numpy as np
-from random import randrange as rand
+import random
+from itertools import islice
 from random import randint
-import pygame, sys
-import time
+import sys, os, shutil
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from engine import bitboard, landing, batch, features, boards, transposition, phases
+from engine.pieces import PieceTable
+from engine.stats import BoardStats
 # The configuration
 cell_size =	18
 cols =		10
 rows =		22
 maxfps = 	30
+batch_eval = True # score all placements of a stone in one numpy batch
+tt_size = 1 << 15 # searches kept in the transposition table, 0 turns it off
+profiling = False # count calls and time of the hot phases, a summary per LSTDQ iteration
 
 colors = [
 (0,   0,   0  ),
@@ -84,350 +94,118 @@ tetris_shapes = [
 	 [7, 7]],
 ]
 
-# # # # # # # # # # # # # # # # # # # # # # # # 
-"""These heuristics attempt to assess how favourable a given board is.
-The board should already have the dummy 23rd row stripped out.
-When the heuristic says "block" it means one individual cell of a stone.
-
-How you weight the different heuristics is up to you. 
-Most are designed to indicate bad things, and so should have negative weights.
-"""
-
-def _is_block(cell):
-	return cell != 0
-
-def _is_empty(cell):
-	return cell == 0
-
-####################################################################
-##The features are calculated here
-####################################################################
-def _holes_in_board(board):
-	"""A hole is defined as an empty space below a block. 
-	The block doesn't have to be directly above the hole for it to count.
-	This function identifies any holes and returns them as a [(x,y)]
-	"""
-	holes = []
-	block_in_col = False
-	for x in range(len(board[0])):
-		for y in range(len(board)):
-			if block_in_col and _is_empty(board[y][x]):
-				holes.append((x,y))
-			elif _is_block(board[y][x]):
-				block_in_col = True
-		block_in_col = False
-	return holes
-
-def num_holes(board):
-	"""Number of holes that exist on the board."""
-	return len(_holes_in_board(board))
-
-def num_blocks_above_holes(board):
-	"""Number of blocks that are placed above holes. Note that the block
-	doesn't have to be directly above the hole, a stack of three blocks on
-	top of a single hole will give a result of 3."""
-	c = 0
-	for hole_x, hole_y in _holes_in_board(board):
-		for y in range(hole_y-1, 0, -1):
-			if _is_block(board[y][hole_x]):
-				c += 1
-			else:
-				break
-	return c
-
-def num_gaps(board):
-	"""Like holes, but horizontal. Discourages waiting for the magic I-beam piece.
-	Need to find block-gap-block sequences. A wall can substitute for a block."""
-	gaps = []
-	sequence = 0 # 0 = no progress, 1 = found block, 2 = found block-gap, 3 = found block-gap-block (not used)
-	board_copy = []
-
-	# Make walls into blocks for simplicity
-	for y in range(len(board)):
-		board_copy.append([1] + board[y] + [1])
-
-	# Detect gaps
-	for y in range(len(board_copy)):
-		for x in range(len(board_copy[0])):
-			if sequence == 0 and _is_block(board_copy[y][x]):
-				sequence = 1
-			elif sequence == 1 and _is_empty(board_copy[y][x]):
-				sequence = 2
-			elif sequence == 2:
-				if _is_block(board_copy[y][x]):
-					gaps.append(board_copy[y][x-1])
-					sequence = 1
-				else:
-					sequence = 0
-
-	return len(gaps)	
-
-def max_height(board):
-	"""Height of the highest block on the board"""
-	for idx, row in enumerate(board):
-		for cell in row:
-			if _is_block(cell):
-				return len(board) - idx-1
-
-def num_blocks(board):
-	"""Number of blocks that exist on the board."""
-	c = 0
-	for row in board:
-		for cell in row:
-			if _is_block(cell):
-				c += 1
-	return c
-
-def avg_height(board):
-	"""Average height of blocks on the board"""
-	total_height = 0
-	for height, row in enumerate(reversed(board[1:])):
-		for cell in row:
-			if _is_block(cell):
-				total_height += height
-	return total_height / num_blocks(board)
-
-def sum_adj_diff(board):
-	diff = 0
-	done = [0 for i in xrange(cols)]
-	height = [0 for i in xrange(cols)]
-
-	for idx, row in enumerate(board):
-		for i in range(len(row)):
-			if _is_block(row[i]) and done[i] == False:
-				done[i] = 1
-				height[i] = len(board) - idx - 1
-	for i in range(cols-1):
-		diff += abs(height[i+1] - height[i])
-	return diff
-
-
-######################################################################
-##End of features calculation
-######################################################################
-
-def rotate_clockwise(shape):
-	return [ [ shape[y][x]
-			for y in xrange(len(shape)) ]
-		for x in xrange(len(shape[0]) - 1, -1, -1) ]
-
-def check_collision(board, shape, offset):
-	off_x, off_y = offset
-	for cy, row in enumerate(shape):
-		for cx, cell in enumerate(row):
-			try:
-				if cell and board[ cy + off_y ][ cx + off_x ]:
-					return True
-			except IndexError:
-				return True
-	return False
-
-def remove_row(board, row):
-	del board[row]
-	return [[0 for i in xrange(cols)]] + board
-	
-def join_matrixes(mat1, mat2, mat2_off):
-	off_x, off_y = mat2_off
-	for cy, row in enumerate(mat2):
-		for cx, val in enumerate(row):
-			try:
-				mat1[cy+off_y-1][cx+off_x] += val
-			except IndexError:
-				pass
-	return mat1
-
-def new_board():
-	board = [ [ 0 for x in xrange(cols) ]
-			for y in xrange(rows) ]
-	board += [[ 1 for x in xrange(cols)]]
-	return board
+piece_table = PieceTable(tetris_shapes, cols) # distinct orientations of every stone, built once
+transpositions = transposition.TranspositionTable(tt_size) if tt_size else None # searched boards, shared by every game and sample
 
 ###
 
 #################################################################
-##A dummyApp same as the Tetris app to calculate valurs in the background
+##Rewards and the move the player of tetris.py makes, to calculate values in the background
 #################################################################
 
 NUM_WEIGHTS = 6
 GAMMA = 0.9  #tried out values
+LSTDQ_MODE = 'matrix' # 'matrix': policy iteration over stored samples (LSTDQ_SOLVE), 'online': Sherman-Morrison update per sample (LSTDQ_OPT)
+DELTA = 10000.0 # ridge term of the matrix solve, the same prior as B = (1/delta) I in LSTDQ_OPT
+SAMPLE_BLOCK = 1024 # samples folded into A and b per numpy block
+SAMPLE_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lspi_samples') # directory the samples are kept in between runs, reused for the same limit and BOARD_SEED, None to regenerate every run
+EPSILON = 0.00001 # policy iteration stops once the (unit length) weights move less than this, or the greedy placements stop changing
+MAX_ITERATIONS = 60 # the weights settle in a damped oscillation (15 to 55 iterations when they do), other sample sets flip between two policies for good
+BOARD_SEED = 0 # seed of the random training boards, None for different boards on every run
 
 def reward(board,weights):
+	ret_vec = features.lspi(features.board_features(board)) # the six features, in one pass
+	return reward_features(ret_vec,weights)
+
+def reward_features(ret_vec,weights): # reward from an already computed feature vector
 	ret_val = 0
-	ret_vec = [num_holes(board),num_blocks_above_holes(board),num_gaps(board),max_height(board),avg_height(board),sum_adj_diff(board)]
+	weights = np.ravel(weights) # the (6,1) column of the LSTDQ weights too, float() of a row of it is an error in newer numpy
 	for i in range(NUM_WEIGHTS):
 		ret_val += float(weights[i])*ret_vec[i]
 	return ret_val
 
-class DumApp(object):
-	def __init__(self):
-		self.init_game()
-
-	def init_game(self):
-		self.gameover = False
-		self.paused = False
-		self.board = new_board()
-		self.level = 1
-		self.score = 0
-		self.lines = 0
-
-	def add_cl_lines(self, n):
-		linescores = [0, 40, 100, 300, 1200]
-		self.lines += n
-		self.score += n # linescores[n] * self.level
-		if self.lines >= self.level*6:
-			self.level += 1
-
-	def rotate_stone(self):
-		if not self.gameover and not self.paused:
-			new_stone = rotate_clockwise(self.stone)
-			if not check_collision(self.board,
-			                       new_stone,
-			                       (self.stone_x, self.stone_y)):
-				self.stone = new_stone
-
-	def drop(self): 
-		if not self.gameover and not self.paused:
-			self.stone_y += 1
-			if check_collision(self.board,self.stone,(self.stone_x, self.stone_y)):
-				self.board = join_matrixes(self.board,self.stone,(self.stone_x, self.stone_y))
-				cleared_rows = 0
-				while True:
-					for i, row in enumerate(self.board[:-1]):
-						if 0 not in row:
-							self.board = remove_row(
-							  self.board, i)
-							cleared_rows += 1
-							break
-					else:
-						break
-				self.add_cl_lines(cleared_rows)
-				return True
-		return False
-
-	def decide_move(self,cur_board,cur_stone,wts): # < similar to tetris.py >
-		max_reward = -1000000 # large negative value
-		best_play_rot = 0
-		best_play_xval = 0
-		for ite in range(4):
-			for this_col in range(cols):
-				dummy_App = DumApp()
-				
-				for x in range(rows):
-					for y in range(cols):
-						dummy_App.board[x][y] = cur_board[x][y]
-				dummy_App.stone = cur_stone[:]
-				if this_col > cols - len(cur_stone[0]):
-					break
-				dummy_App.stone_x = this_col
-				dummy_App.stone_y = 0
-				if check_collision( cur_board,cur_stone,(this_col,0) ):
-					continue
-				while 1:
-					
-					var2 = dummy_App.drop()
-					if var2:
-
-						break
-				this_reward = reward(dummy_App.board,wts)
-
-				if this_reward > max_reward:
-					max_reward = this_reward
-					best_play_rot = ite
-					best_play_xval = this_col
-			cur_stone = rotate_clockwise(cur_stone)
-
-		for ano in range(best_play_rot):
-			self.rotate_stone()
-		self.stone_x = best_play_xval
-		while 1: # do this move
-			var = self.drop()
-			if var:
-				break
-###
-
-def GenerateRandomBoard():
-	rnd = randint(1,20) # number of blocks between 1 and 20 for generating random board configuration
-	dummy_game = DumApp()
-	for no_stone in range(rnd):
-		rndstone = tetris_shapes[rand(len(tetris_shapes))]
-		rot = randint(0,3)
-		for rotat in range(rot):
-			rotate_clockwise(rndstone)
-		dummy_game.stone = rndstone
-		# rotation also random
-		dummy_game.stone_x = randint(0,cols-len(rndstone[0]))
-		dummy_game.stone_y = 0
-		if check_collision( dummy_game.board,rndstone,(dummy_game.stone_x,0) ):
-			return GenerateRandomBoard()
-		while 1:
-			var2 = dummy_game.drop()
-			if var2:
-				break
-	final_board = dummy_game.board
-	return final_board
-
+def reward_stats(stats,weights): # same as reward, for a BoardStats
+	return reward_features(features.lspi_stats(stats),weights)
+
+def best_move(stats,stone,wts): # the placement decide_move picks, as (orient, x, features of the board after it) or None
+	if transpositions is None:
+		return search_move(stats,stone,wts)
+	tt_key = transposition.key(stats, [stone], (tuple(np.ravel(wts)), 'best_move'))
+	best = transpositions.get(tt_key, False) # None is a valid result, no placement at all
+	if best is False:
+		best = search_move(stats,stone,wts)
+		transpositions.put(tt_key, best)
+	return best
+
+def search_move(stats,stone,wts): # best_move without the transposition table
+	if batch_eval:
+		moves = batch.placements(stats, piece_table.get(stone))
+		feats = batch.lspi_features(batch.afterstates(stats, moves))
+		best = batch.best(feats, wts)
+		if best < 0:
+			return None
+		return (moves[best][0], moves[best][1], feats[best].tolist())
+	max_reward = -1000000 # large negative value
+	best = None
+	tops = stats.tops()
+	for orient in piece_table.get(stone):
+		for this_col, landing_y in zip(orient.xs, landing.landing_rows(stats.board, tops, orient)):
+			if bitboard.check_collision(stats.board,orient.masks,(this_col,0)):
+				continue
+			after = stats.copy()
+			after.place(orient,this_col,landing_y)
+			ret_vec = features.lspi_stats(after)
+			this_reward = reward_features(ret_vec,wts)
+
+			if this_reward > max_reward:
+				max_reward = this_reward
+				best = (orient, this_col, ret_vec)
+	return best
+
+def training_set(seed=BOARD_SEED): # endless (board, stone) pairs, the same ones on every run for the same seed
+	rng = random.Random(seed)
+	for bboard in boards.random_boards(rng, cols, rows, tetris_shapes, piece_table):
+		yield bboard, tetris_shapes[rng.randrange(len(tetris_shapes))]
 
 ######################################################
 ##The crux of training the weights of the features.
 ##Generate random board in each iteration to get new states on which we can train the AI 
 #######################################################
-def LSTDQ_OPT(limit):
+def LSTDQ_OPT(limit, seed=BOARD_SEED):
 	B = np.zeros((NUM_WEIGHTS,NUM_WEIGHTS)) # B = (1/delta) I
 	for i in range(NUM_WEIGHTS):
 		B[i][i] = 0.0001
 	b = np.zeros((NUM_WEIGHTS,1)) # b = zeros vector
 
 	# random initialisation
-	cur_wts = [(1.0/2)*randint(-2,-1),(1.0/2)*randint(-2,-1),(1.0/2)*randint(-2,-1),(1.0/2)*randint(-2,-1),(1.0/2)*randint(-2,-1),(1.0/2)*randint(-2,-1)]
+	cur_wts = random_weights()
 
-	for i in range(limit):
-		new_state = GenerateRandomBoard()
-		dummy_stone = tetris_shapes[rand(len(tetris_shapes))]
-		stone_x = int(cols / 2 - len(dummy_stone[0])/2)
-		stone_y = 0
+	for new_state, dummy_stone in islice(training_set(seed), limit):
+		since = phases.snapshot()
 		# Iterate over all the possible actions of this stone
-		for rot in range(4):
-			rotate_clockwise(dummy_stone)
-			for this_col in range(cols):
-				dummy_App = DumApp()
-				for x in range(rows):
-					for y in range(cols):
-						dummy_App.board[x][y] = new_state[x][y]
-				dummy_App.stone = dummy_stone[:]
-				if this_col > cols - len(dummy_stone[0]):
-					break
-				dummy_App.stone_x = this_col
-				dummy_App.stone_y = 0
-				if check_collision( new_state,dummy_stone,(this_col,0) ):
+		stats = BoardStats(new_state, cols)
+		tops = stats.tops()
+		for orient in piece_table.get(dummy_stone):
+			for this_col, landing_y in zip(orient.xs, landing.landing_rows(stats.board, tops, orient)):
+				if bitboard.check_collision(stats.board,orient.masks,(this_col,0)):
 					continue
-				while 1:
-					var2 = dummy_App.drop()
-					if var2:
-						break
-				phi = np.array( [num_holes(dummy_App.board),num_blocks_above_holes(dummy_App.board),num_gaps(dummy_App.board),max_height(dummy_App.board),avg_height(dummy_App.board),sum_adj_diff(dummy_App.board)] )
+				after = stats.copy()
+				after.place(orient,this_col,landing_y)
+				phi = np.array( features.lspi_stats(after) )
 				sumphi_ = np.array( [0,0,0,0,0,0] )
 				leng = NUM_WEIGHTS
 				sumReward = 0
-				ns_reward = reward(dummy_App.board,cur_wts)
+				ns_reward = reward_stats(after,cur_wts)
 
 				phi.shape = [phi.shape[0],1]
 				sumphi_.shape = [sumphi_.shape[0],1]
 
 				for next_shape in range(len(tetris_shapes)):
-					dummy_App2 = DumApp()
-					for x in range(rows):
-						for y in range(cols):
-							dummy_App2.board[x][y] = dummy_App.board[x][y]
-					dummy_App2.stone = tetris_shapes[next_shape]
-					dummy_App2.stone_x = int(cols / 2 - len(dummy_App2.stone[0])/2)
-					dummy_App2.stone_y = 0
-					
-
-					dummy_App2.decide_move(dummy_App2.board,dummy_App2.stone,cur_wts)
-					phi_ = [num_holes(dummy_App2.board),num_blocks_above_holes(dummy_App2.board),num_gaps(dummy_App2.board),max_height(dummy_App2.board),avg_height(dummy_App2.board),sum_adj_diff(dummy_App2.board)]
+					best = best_move(after,tetris_shapes[next_shape],cur_wts) # what decide_move of tetris.py would play
+					phi_ = best[2] if best is not None else features.lspi_stats(after)
+					here_reward = reward_features(phi_,cur_wts)
 					phi_ = [(1.0/7)*phi_[ite] for ite in range(leng)]
 					sumphi_ = [sumphi_[ite] + phi_[ite] for ite in range(leng)]
-					here_reward = reward(dummy_App2.board,cur_wts)
 					sumReward = sumReward + (1.0/7)*( here_reward - ns_reward )
 					
 
@@ -450,15 +228,156 @@ def LSTDQ_OPT(limit):
 				B = B - diff
 				b = b + np.array( [sumReward*phi[ite] for ite in range(leng)] )
 		cur_wts = np.dot(B,b)
-		print cur_wts
+		print(cur_wts)
+		if phases.enabled:
+			print(phases.report('LSTDQ iteration', since))
 
 	return cur_wts
 
+######################################################
+##Matrix form of LSTDQ: collect every sample first, then build A = Phi^T (Phi - GAMMA Phi') + delta I
+##and b = Phi^T r in numpy blocks and solve once, instead of a rank one update per sample.
+##A sample keeps the features of every placement of every next stone, so the policy dependent
+##parts (Phi' and r) are recomputed from the stored arrays for any weights.
+#######################################################
+def random_weights():
+	return [(1.0/2)*randint(-2,-1) for i in range(NUM_WEIGHTS)]
+
+def max_placements(): # most placements any stone has, the padded width of the next stone features
+	return max(sum(len(orient.xs) for orient in piece_table.get(shape)) for shape in tetris_shapes)
+
+def collect_samples(limit, seed=BOARD_SEED):
+	since = phases.snapshot()
+	width = max_placements()
+	phis, nexts, masks = [], [], []
+	for new_state, dummy_stone in islice(training_set(seed), limit):
+		stats = BoardStats(new_state, cols)
+		for orient, this_col, landing_y in batch.placements(stats, piece_table.get(dummy_stone)):
+			after = stats.copy()
+			after.place(orient,this_col,landing_y)
+			phis.append(features.lspi_stats(after))
+			next_feats = np.zeros((len(tetris_shapes), width, NUM_WEIGHTS), dtype=np.int16)
+			next_mask = np.zeros((len(tetris_shapes), width), dtype=bool)
+			for next_shape in range(len(tetris_shapes)):
+				moves = batch.placements(after, piece_table.get(tetris_shapes[next_shape]))
+				if moves:
+					next_feats[next_shape, :len(moves)] = batch.lspi_features(batch.afterstates(after, moves))
+					next_mask[next_shape, :len(moves)] = True
+			nexts.append(next_feats)
+			masks.append(next_mask)
+	if phases.enabled:
+		print(phases.report('samples', since))
+	return {
+		'phi': np.array(phis, dtype=np.float64).reshape(-1, NUM_WEIGHTS),
+		'next': np.array(nexts, dtype=np.int16).reshape(-1, len(tetris_shapes), width, NUM_WEIGHTS),
+		'mask': np.array(masks, dtype=bool).reshape(-1, len(tetris_shapes), width),
+	}
+
+def greedy(next_feats, next_mask, wts): # index of the placement the greedy policy of wts picks for every sample and next stone
+	values = np.where(next_mask, next_feats.dot(np.asarray(wts, dtype=np.float64).ravel()), -np.inf)
+	return values.argmax(axis=2)
+
+def greedy_placements(samples, wts): # greedy over all stored samples, in blocks
+	return np.concatenate([greedy(samples['next'][start:start + SAMPLE_BLOCK], samples['mask'][start:start + SAMPLE_BLOCK], wts)
+		for start in range(0, len(samples['phi']), SAMPLE_BLOCK)])
+
+def policy_block(phi, next_feats, next_mask, wts): # Phi' and r of a block of samples under the greedy policy of wts
+	wts = np.asarray(wts, dtype=np.float64).ravel()
+	best = greedy(next_feats, next_mask, wts)
+	best_feats = np.take_along_axis(next_feats, best[:, :, None, None], axis=2)[:, :, 0].astype(np.float64)
+	stuck = ~next_mask.any(axis=2) # no placement for that stone: decide_move leaves the board as it is
+	best_feats[stuck] = np.repeat(phi[:, None], next_mask.shape[1], axis=1)[stuck]
+	phi_next = best_feats.mean(axis=1)
+	reward = best_feats.dot(wts).mean(axis=1) - phi.dot(wts)
+	return phi_next, reward
+
+def LSTDQ_SOLVE(samples, wts):
+	A = DELTA*np.eye(NUM_WEIGHTS)
+	b = np.zeros(NUM_WEIGHTS)
+	for start in range(0, len(samples['phi']), SAMPLE_BLOCK):
+		block = slice(start, start + SAMPLE_BLOCK)
+		phi = samples['phi'][block]
+		phi_next, reward = policy_block(phi, samples['next'][block], samples['mask'][block], wts)
+		A += phi.T.dot(phi - GAMMA*phi_next)
+		b += phi.T.dot(reward)
+	return np.linalg.solve(A, b).reshape(NUM_WEIGHTS, 1)
+
+def samples_meta(limit, seed): # what a set of stored samples was collected with, random.Random
+	return {'limit': limit, 'seed': seed, 'placements': max_placements(), 'python': sys.version_info[0]} # draws other boards under python2 and 3
+
+def save_samples(samples, path, meta): # one .npy per array and meta.json, written to a temporary directory first
+	tmp = path + '.tmp'
+	if not os.path.isdir(tmp):
+		os.makedirs(tmp)
+	for name, arr in samples.items():
+		np.save(os.path.join(tmp, name + '.npy'), arr)
+	with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+		json.dump(meta, f)
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	os.rename(tmp, path)
+
+def load_meta(path): # None for a directory without (readable) meta.json
+	try:
+		with open(os.path.join(path, 'meta.json')) as f:
+			return json.load(f)
+	except (IOError, OSError, ValueError):
+		return None
+
+def load_samples(path): # memory mapped, blocks are paged in as LSTDQ_SOLVE reaches them
+	return dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r')) for name in ('phi', 'next', 'mask'))
+
+def stored_samples(limit, path=SAMPLE_STORE, seed=BOARD_SEED):
+	"""The samples of limit boards of seed, from path when they were stored
+	there with the same limit, seed and placement width, collected (and
+	stored) otherwise. seed None means fresh boards, they are never reused."""
+	meta = samples_meta(limit, seed)
+	if path is not None and seed is not None and os.path.isdir(path) and load_meta(path) == meta:
+		return load_samples(path)
+	samples = collect_samples(limit, seed)
+	if path is not None:
+		save_samples(samples, path, meta)
+		samples = load_samples(path)
+	return samples
+
+def unit(wts): # the reward is linear in the weights, so only their direction matters: keep them at length one
+	return wts/np.linalg.norm(wts)
+
+def LSPI_MATRIX(samples):
+	cur_wts = unit(np.array(random_weights()).reshape(NUM_WEIGHTS, 1))
+	cur_moves = greedy_placements(samples, cur_wts)
+	for iteration in range(MAX_ITERATIONS):
+		since = phases.snapshot()
+		new_wts = unit(LSTDQ_SOLVE(samples, cur_wts))
+		new_moves = greedy_placements(samples, new_wts)
+		change = np.linalg.norm(new_wts - cur_wts)
+		moved = np.count_nonzero(new_moves != cur_moves) # greedy placements the new weights pick differently
+		cur_wts, cur_moves = new_wts, new_moves
+		print(iteration, change, moved, cur_wts.ravel())
+		if phases.enabled:
+			print(phases.report('LSTDQ iteration', since))
+		if change < EPSILON or moved == 0:
+			break
+	else:
+		print('LSPI: no convergence after %d iterations, %d greedy placements still changed' % (MAX_ITERATIONS, moved))
+	return cur_wts
+
 def LSPI():
-	# epsilon = 0.00001
 	limit = 200 # number of random samples : pretty less because we were limited by computation power, yet the results are pretty promising
-	weights = LSTDQ_OPT(limit) # fixed
+	if LSTDQ_MODE == 'matrix':
+		weights = LSPI_MATRIX(stored_samples(limit))
+	else:
+		weights = LSTDQ_OPT(limit) # fixed
 	return weights
 
-wts_calc = LSPI()
-print wts_calc
+phases.register(sys.modules[__name__], 'reward', 'reward')
+phases.register(sys.modules[__name__], 'reward_stats', 'reward.stats')
+phases.register(sys.modules[__name__], 'best_move', 'decide_move')
+phases.register(sys.modules[__name__], 'collect_samples', 'lstdq.collect')
+phases.register(sys.modules[__name__], 'LSTDQ_SOLVE', 'lstdq.solve')
+if profiling:
+	phases.enable()
+
+if __name__ == '__main__':
+	wts_calc = LSPI()
+	print(wts_calc)
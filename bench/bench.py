@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+"""Throughput benchmarks of the engine, the evaluators and the training loops.
+
+	python3 bench/bench.py genetic		15 x 28 board of Genetic/tetris.py
+	python bench/bench.py lspi			10 x 22 board of LSPI/tetris.py and LSPI.py,
+										python2 or python3
+
+Every metric runs on fixed seeds: the boards come from a fixed corpus drawn
+with engine.boards, the games from fixed PieceStream seeds, so two runs do
+exactly the same work. Rates are the best of a few repeats.
+
+The results are merged into bench/results.json under the name of the
+geometry and compared with the same entries of bench/baseline.json. A metric
+that is worse than the baseline by more than --tolerance is reported and the
+exit status is 1. --save-baseline makes the results the new baseline.
+--kernels python|numba runs on the given engine.kernels backend instead of
+the one picked on import, the backend is kept with the results.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from itertools import islice
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+from engine import bitboard, boards, batch, kernels
+from engine.stats import BoardStats
+from engine.stream import PieceStream, game_seeds
+
+SEED = 12345
+CORPUS = 200					#boards in the corpus
+GAMES = 4						#headless games per repeat
+GAME_STONES = 150				#stones per headless game and per fitness game
+REPEAT = 3
+GENETIC_PARAMS = [38, 32, 59, 45, 46, 10, 40]
+LSPI_WEIGHTS = [-7.98879288e-04,-4.59919586e-03,-9.81677321e-03,-1.01712498e-02,5.93533521e-05,-1.66817345e-03]
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.json')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+class quiet(object):							#the training loops print their progress
+	def __enter__(self):
+		self.stdout = sys.stdout
+		sys.stdout = open(os.devnull, 'w')
+
+	def __exit__(self, *exc):
+		sys.stdout.close()
+		sys.stdout = self.stdout
+
+def seconds(fn, repeat=REPEAT):					#best wall time of repeat calls
+	best = None
+	for i in range(repeat):
+		start = timeit.default_timer()
+		fn()
+		elapsed = timeit.default_timer() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def rate(fn, ops, repeat=REPEAT):				#ops per second, fn does ops operations
+	return {'value': ops / seconds(fn, repeat), 'unit': '1/s'}
+
+def corpus(cols, rows, shapes, table):			#fixed (bitboard, stone) pairs
+	rng = random.Random(SEED)
+	found = list(islice(boards.random_boards(rng, cols, rows, shapes, table), CORPUS))
+	return [(bboard, shapes[rng.randrange(len(shapes))]) for bboard in found]
+
+def engine_metrics(cols, rows, shapes, table):
+	pairs = corpus(cols, rows, shapes, table)
+	checks = [(bboard, orient.masks, (x, y))
+		for bboard, stone in pairs
+		for orient in table.get(stone)
+		for x in orient.xs
+		for y in range(0, rows, 4)]
+	stats = [BoardStats(list(bboard), cols) for bboard, stone in pairs]
+	moves = [(s, batch.placements(s, table.get(stone))) for s, (bboard, stone) in zip(stats, pairs)]
+	n_moves = sum(len(found) for s, found in moves)
+
+	def collisions():
+		check = bitboard.check_collision
+		for bboard, masks, offset in checks:
+			check(bboard, masks, offset)
+
+	def placements():
+		for s, found in moves:
+			for orient, x, y in found:
+				s.copy().place(orient, x, y)
+
+	return pairs, stats, moves, {
+		'collision_checks': rate(collisions, len(checks)),
+		'placements': rate(placements, n_moves),
+	}
+
+def feature_metrics(pairs, stats, cols, name, evaluate, evaluate_stats, features):
+	matrices = [bitboard.to_matrix(bboard, cols) for bboard, stone in pairs]
+	stack = np.array([batch.to_array(bboard, cols) for bboard, stone in pairs])
+
+	def matrix_features():
+		for matrix in matrices:
+			evaluate(matrix)
+
+	def stats_features():
+		for s in stats:
+			evaluate_stats(s)
+
+	return {
+		name: rate(matrix_features, len(matrices)),
+		name + '_stats': rate(stats_features, len(stats)),
+		name + '_batch': rate(lambda: features(stack), len(pairs)),
+	}
+
+def genetic():
+	sys.path.insert(0, os.path.join(ROOT, 'Genetic'))
+	import tetris as T
+	from fitness_cache import FitnessCache
+	T.num_stones = GAME_STONES
+	T.transpositions = None						#repeats would only measure table hits
+	pairs, stats, moves, metrics = engine_metrics(T.cols, T.rows, T.tetris_shapes, T.piece_table)
+	game = T.TetrisGame(GENETIC_PARAMS, PieceStream(SEED, len(T.tetris_shapes)))
+	metrics.update(feature_metrics(pairs, stats, T.cols, 'score_board',
+		game.score_board, game.score_stats, batch.genetic_features))
+
+	def decisions():
+		for bboard, stone in pairs:
+			game.bboard = list(bboard)
+			game.set_stone(stone)
+			game.stone_x = game.spawn_x(stone)
+			game.check_score()
+	metrics['check_score'] = rate(decisions, len(pairs))
+
+	seeds = game_seeds(SEED, GAMES)
+	metrics['games'] = rate(lambda: [T.play_game(GENETIC_PARAMS, s) for s in seeds], GAMES)
+
+	def generation():
+		random.seed(SEED)
+		gen = T.Genetic(workers=1, cache=FitnessCache(0))
+		with quiet():
+			gen.new_population()
+	metrics['ga_generation'] = {'value': seconds(generation, 1), 'unit': 's'}
+	return metrics
+
+def lspi():
+	sys.path.insert(0, os.path.join(ROOT, 'LSPI'))
+	import tetris as T
+	import LSPI as L
+	T.transpositions = None
+	L.transpositions = None
+	pairs, stats, moves, metrics = engine_metrics(T.cols, T.rows, T.tetris_shapes, T.piece_table)
+	metrics.update(feature_metrics(pairs, stats, T.cols, 'reward',
+		lambda matrix: L.reward(matrix, LSPI_WEIGHTS), lambda s: L.reward_stats(s, LSPI_WEIGHTS), batch.lspi_features))
+
+	game = T.TetrisGame(PieceStream(SEED, len(T.tetris_shapes)))
+	def decisions():
+		for bboard, stone in pairs:
+			game.bboard = list(bboard)
+			game.board = bitboard.to_matrix(bboard, T.cols)
+			game.set_stone(stone)
+			game.stone_x = game.spawn_x(stone)
+			game.stone_y = 0
+			game.decide_move(game.board, stone, LSPI_WEIGHTS)
+	metrics['decide_move'] = rate(decisions, len(pairs))
+
+	def games():
+		for s in game_seeds(SEED, GAMES):
+			played = T.TetrisGame(PieceStream(s, len(T.tetris_shapes)))
+			while not played.gameover and played.stones <= GAME_STONES:
+				played.play_move(LSPI_WEIGHTS)
+	metrics['games'] = rate(games, GAMES)
+
+	limit = 20
+	samples = L.collect_samples(limit, SEED)
+	n = len(samples['phi'])
+	metrics['lstdq_collect'] = rate(lambda: L.collect_samples(limit, SEED), n, 1)
+	metrics['lstdq_solve'] = rate(lambda: L.LSTDQ_SOLVE(samples, LSPI_WEIGHTS), n)
+	def online():
+		random.seed(SEED)
+		with quiet():
+			L.LSTDQ_OPT(limit, SEED)
+	metrics['lstdq_online'] = rate(online, n, 1)
+	return metrics
+
+GEOMETRIES = {'genetic': genetic, 'lspi': lspi}
+
+def load(path):
+	if not os.path.exists(path):
+		return {}
+	with open(path) as f:
+		return json.load(f)
+
+def save(path, results):
+	with open(path, 'w') as f:
+		json.dump(results, f, indent=1, sort_keys=True, separators=(',', ': '))
+
+def speedup(metric, base):						#> 1 is better than the baseline
+	if metric['unit'] == 's':
+		return base['value'] / metric['value']
+	return metric['value'] / base['value']
+
+def compare(name, metrics, baseline, tolerance):	#names of the metrics that regressed
+	worse = []
+	base = baseline.get(name, {}).get('metrics', {})
+	for metric in sorted(metrics):
+		found = metrics[metric]
+		line = '%-22s %14.2f %-4s' % (metric, found['value'], found['unit'])
+		if metric in base:
+			ratio = speedup(found, base[metric])
+			line += '  x%.2f vs baseline' % ratio
+			if ratio < 1 - tolerance:
+				line += '  REGRESSION'
+				worse.append(metric)
+		print(line)
+	return worse
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('geometry', choices=sorted(GEOMETRIES))
+	parser.add_argument('--results', default=RESULTS)
+	parser.add_argument('--baseline', default=BASELINE)
+	parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before a metric counts as a regression')
+	parser.add_argument('--save-baseline', action='store_true')
+	parser.add_argument('--kernels', choices=kernels.BACKENDS, help='kernel backend, the one picked on import when left out')
+	args = parser.parse_args(argv)
+
+	if args.kernels is not None:
+		kernels.use(args.kernels)
+	entry = {'python': sys.version.split()[0], 'kernels': kernels.backend, 'metrics': GEOMETRIES[args.geometry]()}
+	results = load(args.results)
+	results[args.geometry] = entry
+	save(args.results, results)
+	worse = compare(args.geometry, entry['metrics'], load(args.baseline), args.tolerance)
+	if args.save_baseline:
+		baseline = load(args.baseline)
+		baseline[args.geometry] = entry
+		save(args.baseline, baseline)
+	return 1 if worse and not args.save_baseline else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
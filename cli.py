@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#-*- coding: utf-8 -*-
+"""One entry point for training, playing and benchmarking.
+
+	python cli.py train-ga [--generations N] [--workers N] [--plot] [--islands N] [--racing]
+	python cli.py ga-coordinator --islands N [--listen HOST:PORT] [--generations N]
+	python cli.py ga-island HOST:PORT
+	python cli.py train-lspi [--mode matrix|online]
+	python cli.py play genetic|lspi [--weights W ...] [--speed realtime|turbo|skip]
+	python cli.py bench genetic|lspi [bench.py options]
+
+Genetic/tetris.py and LSPI/tetris.py share a module name, so every command
+puts only the directory of its own geometry on sys.path. Importing the
+players has no side effects: nothing trains or opens a window until it is
+asked to, pygame is imported by the first TetrisApp and matplotlib only by
+--plot.
+"""
+from __future__ import print_function
+import argparse
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIES = {'genetic': 'Genetic', 'lspi': 'LSPI'}
+SPEEDS = ('realtime', 'turbo', 'skip')
+
+def load(geometry, module='tetris'):					#a module of Genetic/ or LSPI/
+	sys.path.insert(0, os.path.join(ROOT, DIRECTORIES[geometry]))
+	return importlib.import_module(module)
+
+def workers(T, args):
+	return T.workers if args.workers is None else args.workers or None	#0 is one per core
+
+def train_ga(args):
+	T = load('genetic')
+	if args.racing:
+		T.racing = True
+	if args.islands:
+		islands = importlib.import_module('islands')
+		coordinator = islands.run_local(args.islands, args.generations,
+			T.migration if args.migration is None else args.migration,
+			T.migrants if args.migrants is None else args.migrants, workers(T, args))
+		print('best', coordinator.best())
+		return
+	gen = T.Genetic(workers=workers(T, args))
+	gen.run(args.generations)
+	if args.plot:
+		gen.plot()
+
+def ga_coordinator(args):
+	T = load('genetic')
+	islands = importlib.import_module('islands')
+	host, port = islands.parse_address(args.listen)
+	coordinator = islands.Coordinator(args.islands, host, port, args.generations,
+		T.migration if args.migration is None else args.migration,
+		T.migrants if args.migrants is None else args.migrants)
+	print('waiting for %d islands on %s:%d' % ((args.islands,) + coordinator.address[:2]))
+	print('best', coordinator.run())
+
+def ga_island(args):
+	T = load('genetic')
+	islands = importlib.import_module('islands')
+	islands.run_island(islands.parse_address(args.coordinator), workers(T, args))
+
+def train_lspi(args):
+	L = load('lspi', 'LSPI')
+	if args.mode is not None:
+		L.LSTDQ_MODE = args.mode
+	print(L.LSPI())
+
+def play(args):
+	T = load(args.geometry)
+	if args.geometry == 'genetic':
+		app = T.TetrisApp([int(w) for w in args.weights] if args.weights else T.best_params, True)
+		app.run(args.speed)
+	else:
+		app = T.TetrisApp()
+		app.run(args.weights or T.learned_wts, args.speed)
+
+def bench(args):
+	sys.path.insert(0, os.path.join(ROOT, 'bench'))
+	return importlib.import_module('bench').main(args.args)
+
+def island_options(parser):
+	parser.add_argument('--migration', type=int, help='generations between migrations (default: migration of Genetic/tetris.py)')
+	parser.add_argument('--migrants', type=int, help='chromosomes sent at every migration (default: migrants of Genetic/tetris.py)')
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	commands = parser.add_subparsers(dest='command')
+	commands.required = True
+
+	found = commands.add_parser('train-ga', help='evolve the weights of the Genetic player')
+	found.add_argument('--generations', type=int, default=10)
+	found.add_argument('--workers', type=int, default=None, help='processes playing fitness games, 0 for one per core (default: workers of Genetic/tetris.py)')
+	found.add_argument('--plot', action='store_true', help='plot the average score per generation at the end')
+	found.add_argument('--islands', type=int, default=0, help='island model with this many island processes on this machine')
+	found.add_argument('--racing', action='store_true', help='race the fitness games, see racing in Genetic/tetris.py')
+	island_options(found)
+	found.set_defaults(run=train_ga)
+
+	found = commands.add_parser('ga-coordinator', help='coordinator of an island model GA, the islands connect to it')
+	found.add_argument('--islands', type=int, required=True)
+	found.add_argument('--listen', default='0.0.0.0', help='HOST:PORT, port 5995 when left out')
+	found.add_argument('--generations', type=int, default=10)
+	island_options(found)
+	found.set_defaults(run=ga_coordinator)
+
+	found = commands.add_parser('ga-island', help='one island of an island model GA')
+	found.add_argument('coordinator', help='HOST:PORT of the coordinator')
+	found.add_argument('--workers', type=int, default=None, help='processes playing fitness games, 0 for one per core')
+	found.set_defaults(run=ga_island)
+
+	found = commands.add_parser('train-lspi', help='learn the weights of the LSPI player')
+	found.add_argument('--mode', choices=('matrix', 'online'), help='LSTDQ_MODE of LSPI.py')
+	found.set_defaults(run=train_lspi)
+
+	found = commands.add_parser('play', help='watch a player in a pygame window')
+	found.add_argument('geometry', choices=sorted(DIRECTORIES))
+	found.add_argument('--weights', type=float, nargs='+', help='the best known weights when left out')
+	found.add_argument('--speed', choices=SPEEDS, default='realtime')
+	found.set_defaults(run=play)
+
+	found = commands.add_parser('bench', help='throughput benchmarks, see bench/bench.py')
+	found.add_argument('args', nargs=argparse.REMAINDER)
+	found.set_defaults(run=bench)
+
+	args = parser.parse_args(argv)
+	return args.run(args) or 0
+
+if __name__ == '__main__':
+	sys.exit(main())
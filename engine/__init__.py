@@ -0,0 +1,9 @@
+#-*- coding: utf-8 -*-
+"""Board engine shared by the Genetic and LSPI players.
+
+The code in here is written to run under both python2 (LSPI) and python3
+(Genetic). Only engine.render, the drawing of TetrisApp, needs pygame.
+engine.kernels is imported with the package and switches the hot loops to
+their numba versions when numba is installed.
+"""
+from engine import kernels
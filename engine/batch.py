@@ -0,0 +1,116 @@
+#-*- coding: utf-8 -*-
+"""Batched evaluation of every placement of a stone.
+
+All afterstates of the current stone are stacked into one boolean array of
+shape (candidates, rows + 1, cols), floor row included, and the heuristics of
+both players are computed for the whole stack with array operations. The
+caller takes the argmax of features . weights; np.argmax returns the first
+maximum, which is the same candidate the one-by-one loops keep with their
+strict ">".
+"""
+import numpy as np
+
+from engine import landing
+
+def to_array(bboard, cols):								#bitboard -> (rows + 1, cols) bool array
+	rows = np.array(bboard, dtype=np.int64)
+	return ((rows[:, None] >> (np.arange(cols) + 1)) & 1).astype(bool)
+
+def placements(stats, orients):							#(orient, x, landing row) of every stone position
+	found = []											#that doesn't collide right at spawn
+	tops = stats.tops()
+	for orient in orients:
+		for x, y in zip(orient.xs, landing.landing_rows(stats.board, tops, orient)):
+			if y > 0:
+				found.append((orient, x, y))
+	return found
+
+def afterstates(stats, moves, clear=True):				#the boards after each of moves, stacked
+	base = to_array(stats.board, stats.cols)
+	boards = np.repeat(base[None], len(moves), axis=0)
+	idx_n, idx_y, idx_x = [], [], []
+	for n, (orient, x, y) in enumerate(moves):
+		for dy, dx in orient.cells:
+			idx_n.append(n)
+			idx_y.append(y - 1 + dy)
+			idx_x.append(x + dx)
+	boards[idx_n, idx_y, idx_x] = True
+	if clear:
+		boards = clear_rows(boards)
+	return boards
+
+def clear_rows(boards):									#full rows move to the top and are emptied,
+	full = boards.all(axis=2)							#the others keep their order
+	full[:, -1] = False
+	order = np.argsort(~full, axis=1, kind='mergesort')
+	boards = np.take_along_axis(boards, order[:, :, None], axis=1)
+	cleared = full.sum(axis=1)
+	boards[np.arange(boards.shape[1])[None, :] < cleared[:, None]] = False
+	return boards
+
+def _tops(boards):										#row of the highest block per column, the floor
+	return boards.argmax(axis=1)						#row is full so every column has one
+
+def _runs(boards):										#length of the run of blocks ending at each cell,
+	dtype = np.int8 if boards.shape[1] < 128 else np.int16	#a narrow dtype keeps the scans cheap
+	filled = np.cumsum(boards, axis=1, dtype=dtype)
+	reset = np.maximum.accumulate(np.where(boards, 0, filled), axis=1)
+	return filled - reset
+
+def _holes_mask(boards, tops):
+	rows = np.arange(boards.shape[1])[None, :, None]
+	return ~boards & (rows > tops[:, None, :]) & (rows < boards.shape[1] - 1)
+
+def _above_holes(boards, holes, first_row):				#blocks stacked right on top of every hole,
+	runs = _runs(boards[:, first_row:])					#counted from first_row down
+	above = np.zeros(boards.shape, dtype=runs.dtype)
+	above[:, first_row + 1:] = runs[:, :-1]
+	return (above * holes).sum(axis=(1, 2))
+
+def _crop(boards):										#the rows from the highest block of the stack down,
+	top = int(boards.any(axis=2).any(axis=0).argmax())	#the ones above are empty on every board
+	return boards[:, top:], top
+
+def genetic_features(boards):
+	"""Features of Genetic's score_board, one row per board, in the order
+	height, holes, clears, blockades, almost_clear, walls, diff."""
+	boards, top = _crop(boards)
+	tops = _tops(boards)
+	heights = boards.shape[1] - tops					#score_board counts the floor row too
+	holes = _holes_mask(boards, tops)
+	fill = boards.sum(axis=2)
+	return np.stack([
+		heights.sum(axis=1),
+		holes.sum(axis=(1, 2)),
+		(fill == 0).sum(axis=1) + top,
+		_above_holes(boards, holes, 0),
+		((fill == 1) | (fill == 2)).sum(axis=1),
+		heights[:, 0] + heights[:, -1],
+		heights.max(axis=1) - heights.min(axis=1)], axis=1)
+
+def lspi_features(boards):
+	"""Features of the LSPI reward, one row per board, in the order
+	num_holes, num_blocks_above_holes, num_gaps, max_height, avg_height,
+	sum_adj_diff."""
+	n_rows = boards.shape[1]
+	boards, top = _crop(boards)
+	tops = _tops(boards)
+	heights = boards.shape[1] - 1 - tops
+	holes = _holes_mask(boards, tops)
+	walled = np.pad(boards, ((0, 0), (0, 0), (1, 1)), 'constant', constant_values=True)
+	gaps = ~walled[:, :, 1:-1] & walled[:, :, :-2] & walled[:, :, 2:]
+	first = max(1 - top, 0)								#avg_height and the blocks above holes skip row 0
+	row_height = (n_rows - 1 - top - np.arange(boards.shape[1]))[None, :]
+	total_height = (boards[:, first:].sum(axis=2) * row_height[:, first:]).sum(axis=1)
+	return np.stack([
+		holes.sum(axis=(1, 2)),
+		_above_holes(boards, holes, first),
+		gaps.sum(axis=(1, 2)),
+		heights.max(axis=1),
+		total_height // boards.sum(axis=(1, 2)),
+		np.abs(np.diff(heights, axis=1)).sum(axis=1)], axis=1)
+
+def best(features, weights):							#index of the best board, -1 when there is none
+	if not len(features):
+		return -1
+	return int(np.argmax(features.dot(np.asarray(weights, dtype=float).ravel())))
@@ -0,0 +1,80 @@
+#-*- coding: utf-8 -*-
+"""Bitboard version of the board functions in tetris.py.
+
+Every row of the board is a single int. Bit x+1 is set when column x is
+occupied. Bit 0 and every bit above the last column are always set, they
+act as the left and right walls, so a stone that sticks out of the board
+collides with a wall instead of raising IndexError. The last row is the
+floor and has every bit set (-1), which also makes it a "full" row.
+
+    collision   ->  row & stone_row != 0
+    placement   ->  row | stone_row
+    full row    ->  row == FULL
+"""
+
+FULL = -1
+
+def empty_row(cols):									#only the walls are set
+	return ~(((1 << cols) - 1) << 1)
+
+def shape_masks(shape):									#one mask per row of the stone, at x = 0
+	masks = []
+	for row in shape:
+		m = 0
+		for cx, val in enumerate(row):
+			if val:
+				m |= 1 << (cx + 1)
+		masks.append(m)
+	return tuple(masks)
+
+def new_board(cols, rows):
+	return [empty_row(cols)] * rows + [FULL]
+
+def from_matrix(board, cols):							#list of lists -> bitboard, the floor row is kept
+	bboard = []
+	for row in board:
+		m = empty_row(cols)
+		for x, val in enumerate(row):
+			if val:
+				m |= 1 << (x + 1)
+		bboard.append(m)
+	return bboard
+
+def to_matrix(bboard, cols, val=1):						#bitboard -> list of lists, cells are set to val
+	return [ [ val if (row >> (x + 1)) & 1 else 0
+			for x in range(cols) ]
+		for row in bboard ]
+
+def check_collision(bboard, masks, offset):
+	off_x, off_y = offset
+	if off_x < 0 or off_y + len(masks) > len(bboard):
+		return True
+	for cy, m in enumerate(masks):
+		if bboard[cy + off_y] & (m << off_x):
+			return True
+	return False
+
+def drop_row(bboard, masks, off_x, off_y=0):			#first offset at which the stone collides,
+	while not check_collision(bboard, masks, (off_x, off_y)):	#same value the step-by-step
+		off_y += 1										#drop loops end up with
+	return off_y
+
+def join_matrixes(bboard, masks, offset):				#like tetris.join_matrixes, the stone goes
+	off_x, off_y = offset								#one row above the colliding offset
+	for cy, m in enumerate(masks):
+		bboard[cy + off_y - 1] |= m << off_x
+	return bboard
+
+def clear_rows(bboard, cols):							#removes every full row above the floor
+	kept = [row for row in bboard[:-1] if row != FULL]
+	n = len(bboard) - 1 - len(kept)
+	return [empty_row(cols)] * n + kept + bboard[-1:], n
+
+def place(bboard, masks, off_x, cols, off_y=None):		#drops the stone from the top at column off_x and clears
+	if check_collision(bboard, masks, (off_x, 0)):		#the full rows, returns (new bitboard, cleared rows) or
+		return None										#None when the stone can't even spawn there.
+	if off_y is None:									#off_y is the landing row when the caller
+		off_y = drop_row(bboard, masks, off_x)			#already knows it
+	after = list(bboard)
+	join_matrixes(after, masks, (off_x, off_y))
+	return clear_rows(after, cols)
@@ -0,0 +1,32 @@
+#-*- coding: utf-8 -*-
+"""Random boards to train on.
+
+A board is built by placing a random number of stones, each in a random
+orientation and column, straight onto the bitboard: no game object and no
+row by row drop. A stone that can't spawn in the column it drew goes to a
+random column it fits in, and when it fits nowhere the board is finished as
+it is, so no board is ever thrown away and started over.
+
+rng is anything with randint, randrange and choice: a random.Random(seed)
+gives the same boards on every run, the random module itself follows the
+global random state.
+"""
+from engine import bitboard
+
+def random_board(rng, cols, rows, shapes, table, max_stones=20):
+	bboard = bitboard.new_board(cols, rows)
+	for i in range(rng.randint(1, max_stones)):
+		orients = table.get(shapes[rng.randrange(len(shapes))])
+		orient = orients[rng.randint(0, 3) % len(orients)]	#orientations repeat every len(orients) rotations
+		placed = bitboard.place(bboard, orient.masks, rng.choice(orient.xs), cols)
+		if placed is None:
+			xs = [x for x in orient.xs if not bitboard.check_collision(bboard, orient.masks, (x, 0))]
+			if not xs:
+				break
+			placed = bitboard.place(bboard, orient.masks, rng.choice(xs), cols)
+		bboard = placed[0]
+	return bboard
+
+def random_boards(rng, cols, rows, shapes, table, max_stones=20):	#endless stream of boards, take a batch
+	while True:														#with itertools.islice
+		yield random_board(rng, cols, rows, shapes, table, max_stones)
@@ -0,0 +1,85 @@
+#-*- coding: utf-8 -*-
+"""All board features of both players in one pass over a board matrix.
+
+The board is a list of rows, floor row last, as score_board and reward get
+it. The rows above the highest block are empty and aren't visited: the
+active region runs from the stack top down to the floor, and every column
+of it is walked once, top to bottom, counting its height, holes, the blocks
+stacked on the holes, the horizontal gaps and the blocks of every row.
+
+board_features returns one vector in the order of FEATURES. GENETIC and
+LSPI pick the features of Genetic's score_board and of the LSPI reward out
+of it, in the order of batch.genetic_features and batch.lspi_features; the
+values are the same as the ones of the separate feature functions.
+lspi_stats reads the LSPI features from a BoardStats instead.
+"""
+
+FEATURES = ('height', 'holes', 'clears', 'blockades', 'almost_clear', 'walls', 'diff',
+	'blocks_above_holes', 'gaps', 'max_height', 'avg_height', 'sum_adj_diff')
+GENETIC = (0, 1, 2, 3, 4, 5, 6)
+LSPI = (1, 7, 8, 9, 10, 11)
+
+def active_top(board):									#row of the highest block, the floor
+	for y, row in enumerate(board):						#row always has one
+		if any(row):
+			return y
+
+def board_features(board):
+	floor = len(board) - 1
+	cols = len(board[0])
+	top = active_top(board)
+	columns = list(zip(*board[top:floor])) or [()] * cols	#column-major view of the active rows
+	fill = [0] * (floor - top)							#blocks per active row
+	heights = []										#from the floor row up, 0 for an empty column
+	holes = blockades = above_holes = gaps = total_height = 0
+	for x, column in enumerate(columns):
+		left = columns[x - 1] if x > 0 else None		#None is a wall
+		right = columns[x + 1] if x < cols - 1 else None
+		first = -1
+		run = 0											#blocks right above the current cell,
+		lower_run = 0									#and the ones of them below row 0
+		for i, cell in enumerate(column):
+			if cell:
+				if first < 0:
+					first = i
+				fill[i] += 1
+				run += 1
+				if top + i:
+					lower_run += 1
+					total_height += floor - top - i
+			else:
+				if first >= 0:
+					holes += 1
+					blockades += run
+					above_holes += lower_run
+				run = lower_run = 0
+				if (left is None or left[i]) and (right is None or right[i]):
+					gaps += 1
+		heights.append(floor - top - first if first >= 0 else 0)
+	clears = top + fill.count(0)						#the rows above the stack are empty too
+	almost_clear = fill.count(1) + fill.count(2)
+	blocks = sum(fill) + cols							#the floor row counts as blocks
+	return [
+		sum(heights) + cols,							#score_board counts the floor row in every height
+		holes,
+		clears,
+		blockades,
+		almost_clear,
+		heights[0] + heights[-1] + 2,
+		max(heights) - min(heights),
+		above_holes,
+		gaps,
+		floor - top,
+		total_height // blocks,
+		sum(abs(heights[x + 1] - heights[x]) for x in range(cols - 1))]
+
+def genetic(found):										#features of score_board, in order
+	return [found[i] for i in GENETIC]
+
+def lspi(found):										#features of the LSPI reward, in order
+	return [found[i] for i in LSPI]
+
+def lspi_stats(stats):									#lspi(board_features(board)) of the board of a BoardStats,
+	total_height = stats.height_sum - stats.row_fill[0]*stats.floor	#without scanning it. avg_height skips the top row
+	return [sum(stats.holes), stats.blocks_above_holes(), stats.gaps(), stats.max_height(),
+		total_height // (stats.blocks + stats.cols), stats.bumpiness()]
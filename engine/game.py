@@ -0,0 +1,151 @@
+#-*- coding: utf-8 -*-
+"""Headless tetris game, the game logic of TetrisApp without pygame.
+
+The board is kept twice: self.board is the usual list of lists with the
+colours of the stones (what the renderer draws and the heuristics read) and
+self.bboard is the bitboard used for collisions and line clears. Both are
+updated together when a stone lands.
+
+TetrisApp in Genetic/ and LSPI/ subclass Game and only add the window,
+drawing and the pygame timer. Training builds a Game (or the player built
+on it) directly and runs at CPU speed without a display. Given a PieceStream
+the game plays a fixed, reproducible sequence of stones.
+"""
+from random import randrange as rand
+
+from engine import bitboard, phases
+from engine.pieces import rotate_clockwise
+
+class Game(object):
+	linescores = [0, 40, 100, 300, 1200]
+	manual_drop_score = 1								#points for every row of a manual drop
+
+	def __init__(self, cols, rows, shapes, stream=None):
+		self.cols = cols
+		self.rows = rows
+		self.shapes = shapes
+		self.stream = stream							#PieceStream for a seeded game, None for random stones
+		self.gameover = False
+		self.paused = False
+		self.next_stone = self.random_stone()
+		self.init_game()
+
+	def random_stone(self):
+		if self.stream is not None:
+			return self.shapes[self.stream.draw()]
+		return self.shapes[rand(len(self.shapes))]
+
+	def init_game(self):
+		self.board = [ [ 0 for x in range(self.cols) ]
+				for y in range(self.rows) ]
+		self.board += [[ 1 for x in range(self.cols)]]
+		self.bboard = bitboard.new_board(self.cols, self.rows)
+		self.stones = 0
+		self.level = 1
+		self.score = 0
+		self.lines = 0
+		self.phases_since = phases.snapshot() if phases.enabled else None
+		self.new_stone()
+
+	def phase_report(self):								#calls and times of this game, with profiling on
+		return phases.report('game', self.phases_since)
+
+	def set_stone(self, stone):
+		self.stone = stone
+		self.masks = bitboard.shape_masks(stone)
+
+	def new_stone(self):
+		self.set_stone(self.next_stone[:])
+		self.next_stone = self.random_stone()
+		self.stone_x = self.spawn_x(self.stone)
+		self.stone_y = 0
+		self.stones += 1
+		if bitboard.check_collision(self.bboard,
+		                            self.masks,
+		                            (self.stone_x, self.stone_y)):
+			self.gameover = True
+
+	def spawn_x(self, stone):							#column a new stone starts in, with the division
+		return int(self.cols / 2 - len(stone[0])/2)		#of the python running the game
+
+	def line_score(self, n):
+		return self.linescores[n] * self.level
+
+	def add_cl_lines(self, n):
+		self.lines += n
+		self.score += self.line_score(n)
+		if self.lines >= self.level*6:
+			self.level += 1
+			self.level_up()
+
+	def level_up(self):									#hook for the renderer, it speeds up its timer
+		pass
+
+	def move(self, delta_x):
+		if not self.gameover and not self.paused:
+			new_x = self.stone_x + delta_x
+			if new_x < 0:
+				new_x = 0
+			if new_x > self.cols - len(self.stone[0]):
+				new_x = self.cols - len(self.stone[0])
+			if not bitboard.check_collision(self.bboard,
+			                                self.masks,
+			                                (new_x, self.stone_y)):
+				self.stone_x = new_x
+
+	def rotate_stone(self):
+		if not self.gameover and not self.paused:
+			new_stone = rotate_clockwise(self.stone)
+			if not bitboard.check_collision(self.bboard,
+			                                bitboard.shape_masks(new_stone),
+			                                (self.stone_x, self.stone_y)):
+				self.set_stone(new_stone)
+
+	def lock_stone(self):								#stone_y is the colliding offset, the stone goes
+		off_x, off_y = self.stone_x, self.stone_y		#one row above it like join_matrixes
+		for cy, row in enumerate(self.stone):
+			for cx, val in enumerate(row):
+				if val:
+					self.board[cy+off_y-1][cx+off_x] += val
+		bitboard.join_matrixes(self.bboard, self.masks, (off_x, off_y))
+		touched = range(max(off_y - 1, 0), off_y - 1 + len(self.stone))
+		self.new_stone()
+		self.add_cl_lines(self.clear_rows(touched))
+
+	def clear_rows(self, rows):							#only rows can have been filled by the stone, the
+		full = [y for y in rows if self.bboard[y] == bitboard.FULL]	#board is compacted in one pass
+		if full:
+			n = len(full)
+			lowest = full[-1]
+			kept = [y for y in range(lowest + 1) if y not in full]
+			self.board[n:lowest + 1] = [self.board[y] for y in kept]
+			self.board[:n] = [ [ 0 for x in range(self.cols) ] for y in range(n) ]
+			self.bboard[n:lowest + 1] = [self.bboard[y] for y in kept]
+			self.bboard[:n] = [bitboard.empty_row(self.cols)] * n
+		return len(full)
+
+	def drop(self, manual):
+		if not self.gameover and not self.paused:
+			self.score += self.manual_drop_score if manual else 0
+			self.stone_y += 1
+			if bitboard.check_collision(self.bboard,
+			                            self.masks,
+			                            (self.stone_x, self.stone_y)):
+				self.lock_stone()
+				return True
+		return False
+
+	def insta_drop(self):								#same as calling drop(True) until the stone lands
+		if not self.gameover and not self.paused:
+			off_y = bitboard.drop_row(self.bboard, self.masks, self.stone_x, self.stone_y + 1)
+			self.score += self.manual_drop_score * (off_y - self.stone_y)
+			self.stone_y = off_y
+			self.lock_stone()
+
+	def toggle_pause(self):
+		self.paused = not self.paused
+
+	def start_game(self):
+		if self.gameover:
+			self.init_game()
+			self.gameover = False
@@ -0,0 +1,221 @@
+#-*- coding: utf-8 -*-
+"""Numba versions of the integer loops of the engine, when numba is there.
+
+The kernels are the loops CPython spends its time in on a single board: the
+collision loop of bitboard.drop_row, the skyline landing of every x of an
+orientation with its drop_row fallback (landing.landing_rows), the feature
+pass of features.board_features and the blockades, blocks_above_holes and
+gaps scans of BoardStats. Each one has a twin below that takes the board as an int64
+numpy array (a bitboard row fits, the walls only make it negative) and is
+compiled with numba.njit. The results are the same ints as the ones of the
+python code.
+
+use('numba') puts the compiled versions in place of the python functions,
+the same way phases.enable() puts its timers in; use('python') brings the
+python ones back. The backend is chosen on import: TETRIS_KERNELS=python or
+TETRIS_KERNELS=numba in the environment forces one, otherwise numba is used
+when it can be imported. Select the backend before profiling is enabled.
+
+The line clear and the single collision check stay python: they are a few
+list operations on a handful of rows and the conversion to an array would
+cost more than it saves.
+"""
+import os
+
+import numpy as np
+
+from engine import bitboard, features, landing
+from engine.stats import BoardStats
+
+try:
+	import numba
+except ImportError:										#the python backend is the only one then
+	numba = None
+
+BACKENDS = ('python', 'numba')
+backend = 'python'
+_python = {}											#(owner, attribute) -> the python function
+
+def _jit(fn):											#without numba the kernels still run, slowly,
+	if numba is None:									#as plain python on the arrays
+		return fn
+	return numba.njit(cache=True)(fn)
+
+@_jit
+def _drop_row(rows, masks, off_x, off_y):
+	n = rows.shape[0]
+	while True:
+		if off_x < 0 or off_y + masks.shape[0] > n:
+			return off_y
+		for cy in range(masks.shape[0]):
+			if rows[cy + off_y] & (masks[cy] << off_x):
+				return off_y
+		off_y += 1
+
+@_jit
+def _landing_rows(rows, tops, bottom, masks, xs):		#landing.landing_rows, skyline and drop_row fallback
+	ys = np.empty(xs.shape[0], np.int64)
+	for i in range(xs.shape[0]):
+		x = xs[i]
+		y = tops[x] - bottom[0]
+		for c in range(1, bottom.shape[0]):
+			y = min(y, tops[x + c] - bottom[c])
+		if y <= 0:
+			y = _drop_row(rows, masks, x, 0)
+		ys[i] = y
+	return ys
+
+@_jit
+def _board_features(cells):								#features.board_features of a (rows + 1, cols) array
+	floor = cells.shape[0] - 1
+	cols = cells.shape[1]
+	top = floor
+	for y in range(floor):
+		for x in range(cols):
+			if cells[y, x]:
+				top = y
+				break
+		if top < floor:
+			break
+	fill = np.zeros(floor - top, np.int64)
+	heights = np.zeros(cols, np.int64)
+	holes = blockades = above_holes = gaps = total_height = 0
+	for x in range(cols):
+		first = -1
+		run = 0
+		lower_run = 0
+		for y in range(top, floor):
+			if cells[y, x]:
+				if first < 0:
+					first = y
+				fill[y - top] += 1
+				run += 1
+				if y:
+					lower_run += 1
+					total_height += floor - y
+			else:
+				if first >= 0:
+					holes += 1
+					blockades += run
+					above_holes += lower_run
+				run = 0
+				lower_run = 0
+				if (x == 0 or cells[y, x - 1]) and (x == cols - 1 or cells[y, x + 1]):
+					gaps += 1
+		if first >= 0:
+			heights[x] = floor - first
+	clears = top
+	almost_clear = 0
+	blocks = cols
+	for i in range(floor - top):
+		if fill[i] == 0:
+			clears += 1
+		elif fill[i] <= 2:
+			almost_clear += 1
+		blocks += fill[i]
+	bumpiness = 0
+	for x in range(cols - 1):
+		bumpiness += abs(heights[x + 1] - heights[x])
+	found = np.empty(12, np.int64)
+	found[0] = heights.sum() + cols
+	found[1] = holes
+	found[2] = clears
+	found[3] = blockades
+	found[4] = almost_clear
+	found[5] = heights[0] + heights[cols - 1] + 2
+	found[6] = heights.max() - heights.min()
+	found[7] = above_holes
+	found[8] = gaps
+	found[9] = floor - top
+	found[10] = total_height // blocks
+	found[11] = bumpiness
+	return found
+
+@_jit
+def _runs_over_holes(rows, heights, floor, first_row):	#blocks stacked right on every hole, from first_row down
+	total = 0
+	for x in range(heights.shape[0]):
+		bit = 1 << (x + 1)
+		run = 0
+		for y in range(max(floor - heights[x], first_row), floor):
+			if rows[y] & bit:
+				run += 1
+			else:
+				total += run
+				run = 0
+	return total
+
+@_jit
+def _gaps(rows, start, floor, cells):
+	total = 0
+	for y in range(start, floor + 1):
+		m = ~rows[y] & (rows[y] << 1) & (rows[y] >> 1) & cells
+		while m:
+			m &= m - 1
+			total += 1
+	return total
+
+_masks = {}
+
+def _mask_array(masks):									#one array per stone orientation
+	found = _masks.get(masks)
+	if found is None:
+		found = _masks[masks] = np.array(masks, dtype=np.int64)
+	return found
+
+def _rows(bboard):
+	return np.array(bboard, dtype=np.int64)
+
+def drop_row(bboard, masks, off_x, off_y=0):
+	return int(_drop_row(_rows(bboard), _mask_array(masks), off_x, off_y))
+
+_orients = {}											#id of an orientation -> (orientation, bottom, xs)
+
+def _orient_arrays(orient):								#the orientation is kept, so its id stays its own
+	found = _orients.get(id(orient))
+	if found is None:
+		found = _orients[id(orient)] = (orient, np.array(orient.bottom, dtype=np.int64), np.array(orient.xs, dtype=np.int64))
+	return found[1], found[2]
+
+def landing_rows(bboard, tops, orient):
+	bottom, xs = _orient_arrays(orient)
+	return _landing_rows(_rows(bboard), np.array(tops, dtype=np.int64), bottom, _mask_array(orient.masks), xs).tolist()
+
+def board_features(board):
+	return _board_features(np.array(board, dtype=np.int8)).tolist()
+
+def blockades(self):
+	return int(_runs_over_holes(_rows(self.board), np.array(self.heights, dtype=np.int64), self.floor, 0))
+
+def blocks_above_holes(self):
+	return int(_runs_over_holes(_rows(self.board), np.array(self.heights, dtype=np.int64), self.floor, 1))
+
+def gaps(self):
+	return int(_gaps(_rows(self.board), self.top(), self.floor, self.cells))
+
+KERNELS = [
+	(bitboard, 'drop_row', drop_row),
+	(landing, 'landing_rows', landing_rows),
+	(features, 'board_features', board_features),
+	(BoardStats, 'blockades', blockades),
+	(BoardStats, 'blocks_above_holes', blocks_above_holes),
+	(BoardStats, 'gaps', gaps),
+]
+
+def use(name=None):
+	"""Switches every kernel to the backend name, 'python' or 'numba'; None
+	is numba when it is installed. Returns the name of the backend."""
+	global backend
+	if name is None:
+		name = 'python' if numba is None else 'numba'
+	if name not in BACKENDS:
+		raise ValueError('unknown kernel backend %r, expected one of %s' % (name, ', '.join(BACKENDS)))
+	if name == 'numba' and numba is None:
+		raise ImportError('the numba kernel backend needs numba')
+	for owner, attribute, compiled in KERNELS:
+		original = _python.setdefault((owner, attribute), owner.__dict__[attribute])
+		setattr(owner, attribute, compiled if name == 'numba' else original)
+	backend = name
+	return name
+
+use(os.environ.get('TETRIS_KERNELS') or None)
@@ -0,0 +1,27 @@
+#-*- coding: utf-8 -*-
+"""Landing rows from the skyline of the board.
+
+A stone dropped straight down from the top comes to rest on the highest
+occupied cell under each of its columns, so the landing row only depends on
+the column tops and the bottom profile of the orientation. That is O(width)
+per candidate instead of one collision check per row.
+
+The rows returned here follow the convention of drop_row / join_matrixes:
+the first offset at which the stone collides, one below where it rests.
+"""
+import numpy as np
+
+from engine import bitboard
+
+def landing_rows(bboard, tops, orient):					#landing row for every x in orient.xs, tops as
+														#BoardStats.tops() gives them
+	tops = np.asarray(tops)
+	n = len(orient.xs)
+	window = np.stack([tops[c:c + n] - orient.bottom[c] for c in range(orient.width)], axis=1)
+	ys = window.min(axis=1).tolist()					#per x, ascending
+	ys = [ys[x] for x in orient.xs]
+	for i, y in enumerate(ys):
+		if y <= 0:										#the stack reaches the spawn rows, the skyline
+														#can't tell holes from the stone's way down
+			ys[i] = bitboard.drop_row(bboard, orient.masks, orient.xs[i])
+	return ys
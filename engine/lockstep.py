@@ -0,0 +1,169 @@
+#-*- coding: utf-8 -*-
+"""Many games advanced together, one stone per game per step.
+
+The boards of N independent games are kept in one (N, rows + 1, cols) bool
+array, floor row included, like the stacks in engine/batch.py. Every step
+scores all placements of every running game's stone in one batch (each game
+has its own weights, so a whole GA population x its fitness games is one
+workload), plays the best placement of each game, clears full rows across
+the batch and masks out the games that are over.
+
+The games end up the same as TetrisGame.play with one stone searched per
+move. As long as the rows a stone can reach while it rotates and slides
+at spawn are empty, the chosen placement is put straight onto the board,
+a hard drop at the chosen column. Once the stack gets up there, a game
+goes the way of the real one: candidates whose skyline landing reaches the
+spawn rows are dropped from the top with bitboard.drop_row like
+landing.landing_rows does, and the chosen move is played out with the
+rotations and slides of TetrisGame.play_move, any of which can be blocked.
+"""
+import numpy as np
+
+from engine import batch, bitboard
+from engine.pieces import rotate_clockwise
+from engine.stream import PieceStream
+
+def stone_indices(seeds, n_shapes, length):				#(games, length) stone indices of seeded games
+	return np.array([PieceStream(seed, n_shapes, length).buffer[:length] for seed in seeds], dtype=np.intp)
+
+def ranks(xs):											#position of every x in the search order of xs
+	found = np.empty(len(xs), dtype=int)
+	found[list(xs)] = np.arange(len(xs))
+	return found
+
+class LockstepGames(object):
+	def __init__(self, cols, rows, table, shapes, pieces, weights, max_stones,
+			features=batch.genetic_features, clear_first=False):
+		self.cols = cols
+		self.pieces = np.asarray(pieces)				#stone indices, one row per game
+		self.weights = np.asarray(weights, dtype=float)	#feature weights, one row per game
+		self.max_stones = max_stones
+		self.features = features
+		self.clear_first = clear_first					#score boards after their full rows are cleared
+		self.shapes = shapes
+		self.orients = [table.get(shape) for shape in shapes]
+		self.ranks = [[ranks(orient.xs) for orient in orients] for orients in self.orients]
+		self.spawn_x = [int(cols / 2 - len(shape[0])/2) for shape in shapes]	#Game.spawn_x
+		self.spawn = []									#cells of every stone where it spawns
+		for shape, spawn_x in zip(shapes, self.spawn_x):
+			self.spawn.append([(y, spawn_x + x) for y, row in enumerate(shape)
+				for x, val in enumerate(row) if val])
+		self.reach = max(max(len(shape), len(shape[0])) for shape in shapes)	#rows a stone covers at spawn, in any rotation
+		n = len(self.pieces)
+		self.boards = np.zeros((n, rows + 1, cols), dtype=bool)
+		self.boards[:, -1] = True
+		self.stones = np.ones(n, dtype=int)				#like Game.stones once the first stone is out
+		self.lines = np.zeros(n, dtype=int)
+		self.active = np.ones(n, dtype=bool)
+		for g in range(n):
+			self.active[g] = not self.collides(self.boards[g], self.pieces[g, 0])
+
+	def collides(self, board, kind):
+		return any(board[y, x] for y, x in self.spawn[kind])
+
+	def bitboard(self, g):								#board of game g as a bitboard, floor row included
+		return bitboard.from_matrix(self.boards[g].tolist(), self.cols)
+
+	def candidates(self, games):						#every placement of every running game's stone
+		tops = self.boards[games].argmax(axis=1)
+		kinds = self.pieces[games, self.stones[games] - 1]
+		bboards = {}									#bitboards of the games that need one this step
+		found = []										#(positions in games, orient, seq, xs, ys)
+		for kind in np.unique(kinds):
+			sel = np.flatnonzero(kinds == kind)
+			for oi, orient in enumerate(self.orients[kind]):
+				n = len(orient.xs)
+				ys = np.stack([tops[sel, c:c + n] - orient.bottom[c] for c in range(orient.width)],
+					axis=2).min(axis=2)
+				for p, x in zip(*np.nonzero(ys <= 0)):	#the skyline can't tell, drop it from the top
+					g = games[sel[p]]
+					if g not in bboards:
+						bboards[g] = self.bitboard(g)
+					ys[p, x] = bitboard.drop_row(bboards[g], orient.masks, int(x))
+				pos, xi = np.nonzero(ys > 0)
+				if len(pos):
+					found.append((sel[pos], orient, oi * self.cols + self.ranks[kind][oi][xi], xi, ys[pos, xi]))
+		return found
+
+	def play_out(self, g, kind, orient, x):				#(shape, x) the stone of game g ends up with when
+		bboard = self.bitboard(g)						#TetrisGame.play_move rotates and slides it to orient, x
+		shape, stone_x = self.shapes[kind], self.spawn_x[kind]
+		for r in range(orient.rot):
+			rotated = rotate_clockwise(shape)
+			if not bitboard.check_collision(bboard, bitboard.shape_masks(rotated), (stone_x, 0)):
+				shape = rotated
+		masks = bitboard.shape_masks(shape)
+		for delta, steps in ((+1, x - self.spawn_x[kind]), (-1, self.spawn_x[kind] - x)):
+			for c in range(max(steps, 0)):
+				new_x = min(max(stone_x + delta, 0), self.cols - len(shape[0]))
+				if not bitboard.check_collision(bboard, masks, (new_x, 0)):
+					stone_x = new_x
+		if masks == orient.masks and stone_x == x:
+			return None									#nothing was in the way
+		return shape, stone_x, bitboard.drop_row(bboard, masks, stone_x)
+
+	def step(self):										#plays one stone in every running game, returns
+		games = np.flatnonzero(self.active)				#False once every game is over
+		if not len(games):
+			return False
+		found = self.candidates(games)
+		if not found:
+			self.active[games] = False
+			return False
+		owner = np.concatenate([f[0] for f in found])
+		seq = np.concatenate([f[2] for f in found])
+		source = np.concatenate([np.full(len(f[0]), k) for k, f in enumerate(found)])	#entry of found of every candidate
+		xs_all = np.concatenate([f[3] for f in found])
+		high = self.boards[games, :self.reach].any(axis=(1, 2))	#stones can be blocked on their way
+		after = self.boards[games[owner]]
+		start = 0
+		for pos, orient, _, xs, ys in found:
+			idx = np.arange(start, start + len(pos))
+			for dy, dx in orient.cells:
+				after[idx, ys - 1 + dy, xs + dx] = True
+			start += len(pos)
+
+		scored = batch.clear_rows(after) if self.clear_first else after
+		scores = (self.features(scored) * self.weights[games[owner]]).sum(axis=1)
+
+		order = np.lexsort((seq, owner))				#same candidate order as the one-by-one search,
+		owner_s = owner[order]							#so ties go the same way
+		scores_s = scores[order]
+		starts = np.flatnonzero(np.r_[True, owner_s[1:] != owner_s[:-1]])
+		best_score = np.maximum.reduceat(scores_s, starts)
+		group = np.cumsum(np.r_[True, owner_s[1:] != owner_s[:-1]]) - 1
+		is_best = np.flatnonzero(scores_s == best_score[group])
+		played, first = np.unique(owner_s[is_best], return_index=True)
+		best = order[is_best[first]]
+
+		moved = games[played]
+		stuck = np.setdiff1d(games, moved)				#no placement at all, the game is over
+		self.active[stuck] = False
+
+		boards = after[best]
+		for i, g in enumerate(moved):					#the move as TetrisGame plays it
+			if high[played[i]]:
+				kind = self.pieces[g, self.stones[g] - 1]
+				blocked = self.play_out(g, kind, found[source[best[i]]][1], int(xs_all[best[i]]))
+				if blocked is not None:
+					shape, x, y = blocked
+					boards[i] = self.boards[g]
+					for dy, row in enumerate(shape):
+						for dx, val in enumerate(row):
+							if val:
+								boards[i, y - 1 + dy, x + dx] = True
+		for i, g in enumerate(moved):					#the next stone is checked before the clear,
+			if self.stones[g] < self.pieces.shape[1]:	#like Game.lock_stone does
+				if self.collides(boards[i], self.pieces[g, self.stones[g]]):
+					self.active[g] = False
+		full = boards[:, :-1].all(axis=2)
+		self.lines[moved] += full.sum(axis=1)
+		self.boards[moved] = batch.clear_rows(boards)
+		self.stones[moved] += 1
+		self.active[moved] &= self.stones[moved] <= self.max_stones
+		return bool(self.active.any())
+
+	def run(self):										#plays every game to the end, lines per game
+		while self.step():
+			pass
+		return self.lines
@@ -0,0 +1,114 @@
+#-*- coding: utf-8 -*-
+"""Opt-in call counts and timers for the hot phases.
+
+Nothing is timed until enable() is called: the registered functions stay the
+plain functions, so a run without profiling pays nothing. enable() replaces
+every registered function (module attribute or method) with a wrapper that
+counts its calls and adds up its wall time under the phase name; disable()
+puts the originals back. Calls through a name that was bound before enable()
+(from x import f) aren't seen.
+
+Times are inclusive: check_score contains the score_board calls it makes.
+snapshot() takes the counters as they are, report(title, since) formats what
+happened after an earlier snapshot, one line per phase, so the players can
+print a summary per game, per generation or per LSTDQ iteration.
+
+The engine's own phases are registered here, the players register theirs
+(score_board, reward, check_score, ...) with register(). engine/render.py
+registers its own when it is imported, so profiling a headless run doesn't
+import pygame.
+"""
+import importlib
+import timeit
+
+enabled = False
+counters = {}											#phase -> [calls, seconds]
+_registered = []										#(owner, attribute, phase)
+_originals = {}											#(owner, attribute) -> function
+
+ENGINE_PHASES = [
+	('engine.bitboard', None, 'check_collision', 'check_collision'),
+	('engine.bitboard', None, 'join_matrixes', 'join_matrixes'),
+	('engine.bitboard', None, 'clear_rows', 'line_clear'),
+	('engine.game', 'Game', 'lock_stone', 'lock_stone'),
+	('engine.game', 'Game', 'clear_rows', 'line_clear'),
+	('engine.stats', 'BoardStats', 'place', 'stats.place'),
+	('engine.stats', 'BoardStats', 'clear_rows', 'line_clear'),
+	('engine.stats', 'BoardStats', 'blockades', 'feature.blockades'),
+	('engine.stats', 'BoardStats', 'blocks_above_holes', 'feature.blocks_above_holes'),
+	('engine.stats', 'BoardStats', 'gaps', 'feature.gaps'),
+	('engine.features', None, 'board_features', 'feature.board'),
+	('engine.features', None, 'lspi_stats', 'feature.stats'),
+	('engine.batch', None, 'placements', 'batch.placements'),
+	('engine.batch', None, 'afterstates', 'batch.afterstates'),
+	('engine.batch', None, 'genetic_features', 'feature.batch'),
+	('engine.batch', None, 'lspi_features', 'feature.batch'),
+	('engine.search', None, 'lookahead', 'search'),
+]
+
+def register(owner, attribute, phase):					#owner is a module or a class
+	_registered.append((owner, attribute, phase))
+	if enabled:
+		_wrap(owner, attribute, phase)
+
+def _wrap(owner, attribute, phase):
+	if (owner, attribute) in _originals:
+		return
+	fn = owner.__dict__[attribute]						#the plain function, also for methods
+	counter = counters.setdefault(phase, [0, 0.0])
+	clock = timeit.default_timer
+
+	def timed(*args, **kwargs):
+		start = clock()
+		try:
+			return fn(*args, **kwargs)
+		finally:
+			counter[0] += 1
+			counter[1] += clock() - start
+	timed.__name__ = fn.__name__
+	timed.__doc__ = fn.__doc__
+	_originals[(owner, attribute)] = fn
+	setattr(owner, attribute, timed)
+
+def _engine_phases():									#imported here, the engine modules don't import this one
+	for module, cls, attribute, phase in ENGINE_PHASES:
+		owner = importlib.import_module(module)
+		if cls is not None:
+			owner = getattr(owner, cls)
+		yield owner, attribute, phase
+
+def enable():
+	global enabled
+	enabled = True
+	for owner, attribute, phase in list(_engine_phases()) + _registered:
+		_wrap(owner, attribute, phase)
+
+def disable():
+	global enabled
+	enabled = False
+	for (owner, attribute), fn in _originals.items():
+		setattr(owner, attribute, fn)
+	_originals.clear()
+
+def reset():
+	for counter in counters.values():
+		counter[0] = 0
+		counter[1] = 0.0
+
+def snapshot():
+	return dict((phase, tuple(counter)) for phase, counter in counters.items())
+
+def summary(since=None):								#(phase, calls, seconds) after since, slowest first
+	since = since or {}
+	found = []
+	for phase, (calls, seconds) in counters.items():
+		old_calls, old_seconds = since.get(phase, (0, 0.0))
+		if calls > old_calls:
+			found.append((phase, calls - old_calls, seconds - old_seconds))
+	return sorted(found, key=lambda entry: -entry[2])
+
+def report(title, since=None):
+	lines = ['%s:' % title]
+	for phase, calls, seconds in summary(since):
+		lines.append('  %-26s %10d calls %10.4f s %8.2f us/call' % (phase, calls, seconds, 1e6 * seconds / calls))
+	return '\n'.join(lines)
@@ -0,0 +1,76 @@
+#-*- coding: utf-8 -*-
+"""Orientation tables for the stones, built once at startup.
+
+For every shape only the distinct orientations are kept: the O stone has one,
+I, S and Z have two and the rest have four. Each orientation carries what the
+move searches need so they don't have to rotate and measure nested lists on
+every move.
+
+The x offsets are tried in ascending order, or, for a table given the spawn
+column of every stone, from the spawn column to the right wall and then from
+it to the left wall. The searches keep the first of equally scored
+placements, so the order decides which one is played.
+"""
+from collections import namedtuple
+
+from engine import bitboard
+
+# rot    - clockwise rotations from the spawn orientation (what rotate_stone has to be called for)
+# shape  - the rotated stone as a list of lists
+# masks  - bitboard row masks of the stone at x = 0
+# width, height
+# bottom - per column, row (from the top of the stone) of the lowest cell
+# top    - per column, row (from the top of the stone) of the highest cell
+# cells  - (row, column) of every block of the stone
+# xs     - legal x offsets on the board, in the order the searches try them
+Orientation = namedtuple('Orientation', 'rot shape masks width height bottom top cells xs')
+
+def rotate_clockwise(shape):
+	return [ [ shape[y][x]
+			for y in range(len(shape)) ]
+		for x in range(len(shape[0]) - 1, -1, -1) ]
+
+def shape_key(shape):
+	return tuple(tuple(row) for row in shape)
+
+def _cells_key(shape):									#colour blind, two orientations are the same
+	return tuple(tuple(1 if val else 0 for val in row) for row in shape)		#when their cells are
+
+def sweep(n, start):									#0..n-1 from start to the right wall, then from
+	start = min(start, n - 1)							#start to the left wall, the order the original
+	return list(range(start, n)) + list(range(start - 1, -1, -1))	#GA check_score tried the columns in
+
+def orientations(shape, cols, spawn_x=None):			#spawn_x: column the stone spawns in, the xs are
+	found = []											#swept from it instead of in ascending order
+	seen = set()
+	for rot in range(4):
+		key = _cells_key(shape)
+		if key not in seen:
+			seen.add(key)
+			width, height = len(shape[0]), len(shape)
+			bottom = tuple(max(y for y in range(height) if shape[y][x])
+				for x in range(width))
+			top = tuple(min(y for y in range(height) if shape[y][x])
+				for x in range(width))
+			cells = tuple((y, x) for y in range(height) for x in range(width) if shape[y][x])
+			found.append(Orientation(rot, shape, bitboard.shape_masks(shape),
+				width, height, bottom, top, cells,
+				range(cols - width + 1) if spawn_x is None else sweep(cols - width + 1, spawn_x)))
+		shape = rotate_clockwise(shape)
+	return found
+
+class PieceTable(object):
+	def __init__(self, shapes, cols, spawn_x=None):		#spawn_x: function of a shape to its spawn column,
+		self.cols = cols								#for the sweep order of the xs
+		self.spawn_x = spawn_x
+		self.table = {}
+		for shape in shapes:
+			self.get(shape)
+
+	def get(self, shape):								#distinct orientations of a stone, shapes that
+		key = shape_key(shape)							#weren't in the table are added on first use
+		found = self.table.get(key)
+		if found is None:
+			found = self.table[key] = orientations(shape, self.cols,
+				None if self.spawn_x is None else self.spawn_x(shape))
+		return found
@@ -0,0 +1,135 @@
+#-*- coding: utf-8 -*-
+"""Drawing of TetrisApp, the only part of the engine that needs pygame.
+
+The screen is never cleared and redrawn cell by cell. The background (the
+grid, the divider and the "Next:" label) is drawn once into a surface,
+every colour has a ready made tile and rendered text is kept until its
+string changes. Each frame the cells on screen are compared with the new
+board, stone and preview, only the cells that changed get the background and
+their tile blitted again, and only their rectangles are passed to
+pygame.display.update.
+"""
+import pygame
+
+from engine import phases
+
+_started = False
+
+def start():											#pygame.init() once per process, not once per App,
+	global _started										#returns pygame for the caller's own module
+	if not _started:
+		pygame.init()
+		_started = True
+	return pygame
+
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+
+class Renderer(object):
+	def __init__(self, screen, cols, rows, cell_size, colors, font, grid=8):
+		self.screen = screen
+		self.cols = cols
+		self.rows = rows
+		self.cell_size = cell_size
+		self.font = font
+		self.width, self.height = screen.get_size()
+		self.rlim = cell_size*cols
+		self.tiles = {}
+		for val, color in enumerate(colors):			#converted before the fill, so the colour is mapped
+			tile = pygame.Surface((cell_size, cell_size)).convert()	#to the screen format like draw.rect does
+			tile.fill(color)
+			self.tiles[val] = tile
+		self.texts = {}
+		self.background = pygame.Surface((self.width, self.height)).convert()
+		self.background.fill(BLACK)
+		for y in range(rows):
+			for x in range(cols):
+				if x%2 == y%2:
+					self.background.blit(self.tiles[grid], self.cell_rect(x, y))
+		pygame.draw.line(self.background, WHITE, (self.rlim+1, 0), (self.rlim+1, self.height-1))
+		self.background.blit(self.text("Next:"), (self.rlim+cell_size, 2))
+		self.invalidate()
+
+	def invalidate(self):								#the next frame redraws the whole screen
+		self.shown = None
+		self.message_shown = None
+
+	def text(self, line):								#rendered once per distinct string
+		found = self.texts.get(line)
+		if found is None:
+			if len(self.texts) > 256:					#scores never come back, don't keep them forever
+				self.texts.clear()
+			found = self.texts[line] = self.font.render(line, False, WHITE, BLACK)
+		return found
+
+	def cell_rect(self, x, y):
+		return pygame.Rect(x*self.cell_size, y*self.cell_size, self.cell_size, self.cell_size)
+
+	def message(self, msg):								#black screen with msg centred, like center_msg
+		if msg == self.message_shown:
+			return
+		self.screen.fill(BLACK)
+		for i, line in enumerate(msg.splitlines()):
+			image = self.text(line)
+			w, h = image.get_size()
+			self.screen.blit(image, (self.width // 2 - w // 2, self.height // 2 - h // 2 + i*22))
+		pygame.display.update()
+		self.shown = None
+		self.message_shown = msg
+
+	def frame(self, board, stone, stone_pos, next_stone):	#colour of every cell: field, then preview
+		cells = {}
+		for y, row in enumerate(board[:self.rows]):
+			for x, val in enumerate(row):
+				if val:
+					cells[(x, y)] = val
+		for matrix, (off_x, off_y) in ((stone, stone_pos), (next_stone, (self.cols+1, 2))):
+			for cy, row in enumerate(matrix):
+				for cx, val in enumerate(row):
+					if val and off_y + cy < self.rows:
+						cells[(off_x + cx, off_y + cy)] = val
+		return cells
+
+	def draw(self, board, stone, stone_pos, next_stone, panel, panel_pos):
+		cells = self.frame(board, stone, stone_pos, next_stone)
+		lines = panel.splitlines()
+		if self.shown is None:						#after a message or on the first frame
+			self.screen.blit(self.background, (0, 0))
+			for (x, y), val in cells.items():
+				self.screen.blit(self.tiles[val], self.cell_rect(x, y))
+			self.draw_panel(lines, panel_pos, [])
+			pygame.display.update()
+		else:
+			dirty = []
+			for pos in set(self.shown) | set(cells):
+				val = cells.get(pos)
+				if val != self.shown.get(pos):
+					rect = self.cell_rect(*pos)
+					self.screen.blit(self.background, rect, rect)
+					if val:
+						self.screen.blit(self.tiles[val], rect)
+					dirty.append(rect)
+			self.draw_panel(lines, panel_pos, dirty)
+			if dirty:
+				pygame.display.update(dirty)
+		self.shown = cells
+		self.message_shown = None
+
+	def draw_panel(self, lines, pos, dirty):			#text lines 14 pixels apart, redrawn when they change
+		old = self.panel if self.shown is not None else []
+		x, y = pos
+		rects = []
+		for i, line in enumerate(lines):
+			image = self.text(line)
+			rect = image.get_rect(topleft=(x, y + i*14))
+			if i >= len(old) or old[i][0] != line:
+				if i < len(old):
+					self.screen.blit(self.background, old[i][1], old[i][1])
+					dirty.append(old[i][1])
+				self.screen.blit(image, rect)
+				dirty.append(rect)
+			rects.append((line, rect))
+		self.panel = rects
+
+phases.register(Renderer, 'draw', 'render')
+phases.register(Renderer, 'message', 'render')
@@ -0,0 +1,72 @@
+#-*- coding: utf-8 -*-
+"""Lookahead over the next stones with a beam.
+
+All placements of the first stone are scored in one batch, as in the one
+stone search, and only the beam best of them are played out: for each one
+the next stone is searched on the board it leaves, and so on for every stone
+in the list. A placement is worth the best value reachable at the last stone.
+A stone that is None isn't known yet (anything after next_stone) and the
+placement is worth the average over all shapes.
+
+evaluate maps a stack of boards from batch.afterstates to one value per
+board, higher is better; the GA and LSPI players pass their own weighted
+features. A line in which some stone can't spawn any more is lost; when every
+line the beam kept is lost the best looking first placement is played.
+
+Given a transposition table every call looks its board up first, keyed by
+the board hash, the stones still to come and version (which has to change
+with the weights behind evaluate).
+"""
+import numpy as np
+
+from engine import batch, transposition
+
+LOST = -np.inf
+
+_missing = object()
+
+def lookahead(stats, stones, table, shapes, evaluate, beam=8, clear=True, tt=None, version=None):
+	"""Best placement of stones[0] as (orient, x, y, value), None when the
+	stone can't be placed at all. clear is passed to batch.afterstates for
+	the boards that are evaluated; the boards the next stones are played on
+	always have their full rows cleared."""
+	if tt is None:
+		return _search(stats, stones, table, shapes, evaluate, beam, clear, tt, version)
+	key = transposition.key(stats, stones, (version, beam, clear))
+	found = tt.get(key, _missing)
+	if found is _missing:
+		found = _search(stats, stones, table, shapes, evaluate, beam, clear, tt, version)
+		tt.put(key, found)
+	return found
+
+def _search(stats, stones, table, shapes, evaluate, beam, clear, tt, version):
+	moves = batch.placements(stats, table.get(stones[0]))
+	if not moves:
+		return None
+	values = evaluate(batch.afterstates(stats, moves, clear=clear))
+	if len(stones) == 1:
+		best = int(np.argmax(values))
+		return moves[best] + (values[best],)
+	best, best_value = None, LOST
+	for i in np.argsort(-values, kind='mergesort')[:beam]:	#stable, ties keep the order of moves
+		orient, x, y = moves[i]
+		after = stats.copy()
+		after.place(orient, x, y)
+		value = _value(after, stones[1:], table, shapes, evaluate, beam, clear, tt, version)
+		if value > best_value:
+			best, best_value = i, value
+	if best is None:
+		return moves[int(np.argmax(values))] + (LOST,)
+	return moves[best] + (best_value,)
+
+def _value(stats, stones, table, shapes, evaluate, beam, clear, tt, version):	#what the board is worth with stones to come
+	if stones[0] is not None:
+		found = lookahead(stats, stones, table, shapes, evaluate, beam, clear, tt, version)
+		return LOST if found is None else found[3]
+	total = 0.0
+	for shape in shapes:
+		found = lookahead(stats, [shape] + stones[1:], table, shapes, evaluate, beam, clear, tt, version)
+		if found is None or found[3] == LOST:
+			return LOST
+		total += found[3]
+	return total / len(shapes)
@@ -0,0 +1,158 @@
+#-*- coding: utf-8 -*-
+"""Board statistics that are kept up to date while stones are placed.
+
+BoardStats wraps a bitboard and keeps the column heights, the holes of every
+column, the fill count of every row, the number of blocks and the summed
+height of the blocks. Placing a stone only touches the columns and rows the
+stone covers, clearing rows only rescans the columns whose top was cleared,
+so the features built on top of these numbers cost O(cols) or O(1) instead
+of a rows x cols scan per candidate board.
+
+Heights are counted from the floor, an empty column has height 0. The floor
+row itself is never counted as blocks or holes. The Zobrist hash of the board
+(engine.transposition) is kept up to date the same way.
+"""
+from engine import bitboard, transposition
+
+def popcount(m):
+	return bin(m).count('1')
+
+class BoardStats(object):
+	def __init__(self, bboard, cols, rescan=True):
+		self.cols = cols
+		self.cells = ((1 << cols) - 1) << 1				#bits of the playing field in a row
+		self.board = bboard
+		self.floor = len(bboard) - 1
+		self.keys = transposition.cell_keys(cols, self.floor)
+		if rescan:
+			self.rescan()
+
+	def rescan(self):									#full recount, only needed for a fresh board
+		self.row_fill = [popcount(row & self.cells) for row in self.board[:-1]] + [self.cols]
+		self.blocks = sum(self.row_fill[:-1])
+		self.height_sum = sum(fill * (self.floor - y) for y, fill in enumerate(self.row_fill))
+		self.hash = transposition.board_hash(self.board, self.cols)
+		self.heights = [0] * self.cols
+		self.holes = [0] * self.cols
+		for x in range(self.cols):
+			self._rescan_column(x)
+
+	def _rescan_column(self, x):
+		bit = 1 << (x + 1)
+		board = self.board
+		y = 0
+		while not board[y] & bit:
+			y += 1
+		self.heights[x] = self.floor - y
+		holes = 0
+		for row in board[y + 1:self.floor]:
+			if not row & bit:
+				holes += 1
+		self.holes[x] = holes
+
+	def copy(self):
+		other = BoardStats(list(self.board), self.cols, rescan=False)
+		other.row_fill = list(self.row_fill)
+		other.blocks = self.blocks
+		other.height_sum = self.height_sum
+		other.hash = self.hash
+		other.heights = list(self.heights)
+		other.holes = list(self.holes)
+		return other
+
+	def top(self):										#row of the highest block, the floor when empty
+		return self.floor - max(self.heights)
+
+	def tops(self):
+		return [self.floor - h for h in self.heights]
+
+	def place(self, orient, off_x, off_y, clear=True):	#off_y as returned by drop_row / landing_rows,
+		rest = off_y - 1								#returns the number of cleared rows
+		floor = self.floor
+		bitboard.join_matrixes(self.board, orient.masks, (off_x, off_y))
+		for cy, m in enumerate(orient.masks):
+			n = popcount(m)
+			self.row_fill[rest + cy] += n
+			self.blocks += n
+			self.height_sum += n * (floor - rest - cy)
+		for dy, dx in orient.cells:
+			self.hash ^= self.keys[rest + dy][off_x + dx]
+		for c in range(orient.width):
+			x = off_x + c
+			old_top = floor - self.heights[x]
+			if rest + orient.bottom[c] < old_top:		#the usual case, the stone sits on top of the column
+				new_top = rest + orient.top[c]
+				self.holes[x] += old_top - new_top - (orient.bottom[c] - orient.top[c] + 1)
+				self.heights[x] = floor - new_top
+			else:										#the stone was pushed into the stack at spawn
+				self._rescan_column(x)
+		if not clear:
+			return 0
+		return self.clear_rows(range(max(rest, 0), rest + orient.height))
+
+	def clear_rows(self, rows):							#removes the full rows among rows in one pass
+		full = [y for y in rows if self.board[y] == bitboard.FULL]
+		if not full:
+			return 0
+		n = len(full)
+		lowest = full[-1]
+		cleared_tops = [x for x in range(self.cols) if self.floor - self.heights[x] in full]
+		kept = [y for y in range(lowest + 1) if y not in full]
+		empty = bitboard.empty_row(self.cols)
+		moved = range(self.top(), lowest + 1)			#rows above the stack top are empty before and after
+		for y in moved:
+			self.hash ^= transposition.row_hash(self.keys[y], self.board[y], self.cols)
+		self.board[n:lowest + 1] = [self.board[y] for y in kept]
+		self.board[:n] = [empty] * n
+		self.row_fill[n:lowest + 1] = [self.row_fill[y] for y in kept]
+		self.row_fill[:n] = [0] * n
+		for y in moved:
+			self.hash ^= transposition.row_hash(self.keys[y], self.board[y], self.cols)
+		self.blocks -= n * self.cols
+		self.height_sum = sum(fill * (self.floor - y) for y, fill in enumerate(self.row_fill[:-1]))
+		for x in range(self.cols):
+			self.heights[x] -= n
+		for x in cleared_tops:
+			self._rescan_column(x)
+		return n
+
+	def max_height(self):
+		return max(self.heights)
+
+	def bumpiness(self):								#sum of height differences of neighbouring columns
+		h = self.heights
+		return sum(abs(h[i + 1] - h[i]) for i in range(self.cols - 1))
+
+	def blockades(self):								#for every run of holes, the blocks stacked
+		total = 0										#right on top of it (up to the previous hole)
+		board = self.board
+		for x in range(self.cols):
+			bit = 1 << (x + 1)
+			block = 0
+			for row in board[self.floor - self.heights[x]:self.floor]:
+				if row & bit:
+					block += 1
+				else:
+					total += block
+					block = 0
+		return total
+
+	def blocks_above_holes(self):						#for every hole, the blocks directly above it,
+		total = 0										#row 0 is not counted
+		board = self.board
+		for x in range(self.cols):
+			bit = 1 << (x + 1)
+			run = 0
+			for y in range(max(self.floor - self.heights[x], 1), self.floor):
+				if board[y] & bit:
+					run += 1
+				else:
+					total += run
+					run = 0
+		return total
+
+	def gaps(self):										#single empty cells between two blocks in a row,
+		total = 0										#walls count as blocks
+		for row in self.board[self.top():]:
+			total += popcount(~row & (row << 1) & (row >> 1) & self.cells)
+		return total
@@ -0,0 +1,37 @@
+#-*- coding: utf-8 -*-
+"""Seeded stone sequences.
+
+A PieceStream is the sequence of stones of one game. It has its own
+random.Random, so the sequence only depends on the seed: not on the module
+level random state, not on which worker process plays the game and not on
+how many stones other games used. The indices are drawn up front into a
+byte array and the buffer is extended if a game outlives it.
+
+Playing every chromosome of a generation on the same seeds (common random
+numbers) takes the luck of the stone sequence out of the ranking.
+"""
+import random
+from array import array
+
+def game_seeds(seed, n):								#seeds of the n games played for one evaluation
+	rng = random.Random(seed)
+	return [rng.randrange(1 << 31) for i in range(n)]
+
+class PieceStream(object):
+	def __init__(self, seed, n_shapes, length=512):
+		self.seed = seed
+		self.n_shapes = n_shapes
+		self.rng = random.Random(seed)
+		self.buffer = array('B')
+		self.pos = 0
+		self.extend(length)
+
+	def extend(self, length):
+		self.buffer.extend(self.rng.randrange(self.n_shapes) for i in range(length))
+
+	def draw(self):										#index of the next stone
+		if self.pos == len(self.buffer):
+			self.extend(len(self.buffer))
+		i = self.buffer[self.pos]
+		self.pos += 1
+		return i
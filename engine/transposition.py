@@ -0,0 +1,67 @@
+#-*- coding: utf-8 -*-
+"""Zobrist hashing of boards and the transposition table of the searches.
+
+Every cell of the playing field has a fixed random 64 bit key and a board
+hashes to the xor of the keys of its blocks. BoardStats keeps the hash up to
+date: placing a stone xors in the keys of its cells, clearing rows rehashes
+only the rows between the stack top and the lowest cleared row, the ones
+that moved.
+
+The table maps (board hash, stones, weights version) to the result of a
+search, so a board that comes up again, from another sample or from the
+search of the previous move, isn't searched twice. version is whatever
+changes with the weights (the weight tuple itself does). The table keeps at
+most size entries, the least recently used go first.
+"""
+import random
+from collections import OrderedDict
+
+from engine.pieces import shape_key
+
+_keys = {}
+
+def cell_keys(cols, rows):								#keys[y][x], the same on every run
+	found = _keys.get((cols, rows))
+	if found is None:
+		rng = random.Random(cols * 1000 + rows)
+		found = _keys[(cols, rows)] = [[rng.getrandbits(64) for x in range(cols)] for y in range(rows)]
+	return found
+
+def row_hash(row_keys, row, cols):
+	h = 0
+	for x in range(cols):
+		if (row >> (x + 1)) & 1:
+			h ^= row_keys[x]
+	return h
+
+def board_hash(bboard, cols):							#the floor row isn't hashed
+	keys = cell_keys(cols, len(bboard) - 1)
+	h = 0
+	for y, row in enumerate(bboard[:-1]):
+		h ^= row_hash(keys[y], row, cols)
+	return h
+
+def key(stats, stones, version):						#None in stones is a stone that isn't known yet
+	return (stats.hash, tuple(None if stone is None else shape_key(stone) for stone in stones), version)
+
+class TranspositionTable(object):
+	def __init__(self, size=1 << 15):
+		self.size = size
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, default=None):
+		if key not in self.entries:
+			self.misses += 1
+			return default
+		self.hits += 1
+		value = self.entries.pop(key)					#reinserted as the most recently used,
+		self.entries[key] = value						#OrderedDict has no move_to_end in python2
+		return value
+
+	def put(self, key, value):
+		self.entries.pop(key, None)
+		self.entries[key] = value
+		while len(self.entries) > self.size:			#evict the least recently used
+			self.entries.popitem(last=False)